@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+from sklearn.metrics import accuracy_score, brier_score_loss, f1_score, log_loss, roc_auc_score
+from xgboost import XGBClassifier
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), "src"))
+
+from evaluation import evaluate  # noqa: E402
+
+
+# =================================================
+"""
+Checks the metrics of evaluation.py against scikit-learn, and compares the time and peak memory of the previous
+evaluation of train_model (full-dataset predict calls, then the metrics) with the chunked evaluation.
+"""
+
+
+def make_data(n_rows, n_features, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, n_features)).astype(np.float32)
+    y = (X @ rng.normal(size=n_features) + 2 * rng.normal(size=n_rows) > 0).astype(np.int64)
+    return X, y
+
+
+def reference_metrics(model, X, y):
+    y_score = model.predict_proba(X)[:, 1]
+    y_pred = y_score >= 0.5
+    return {"test_accuracy": accuracy_score(y, y_pred), "test_f1_score": f1_score(y, y_pred),
+            "test_roc_auc_score": roc_auc_score(y, y_score), "test_brier_score": brier_score_loss(y, y_score),
+            "test_log_loss": log_loss(y, y_score)}
+
+
+def previous_evaluation(model, X, y):
+    # the evaluation train_model used to run: hard predictions, fed to roc_auc_score too
+    y_pred = model.predict(X)
+    return {"test_accuracy": accuracy_score(y, y_pred), "test_roc_auc_score": roc_auc_score(y, y_pred)}
+
+
+def check_parity(model, X, y):
+    expected = reference_metrics(model, X, y)
+    metrics = evaluate(lambda X_chunk: model.predict_proba(X_chunk)[:, 1], X, y, "test", chunk_rows=10000)
+    for name, value in expected.items():
+        print(f"{name}: {metrics[name]:.6f} (scikit-learn {value:.6f}, difference {abs(metrics[name] - value):.1e})")
+        # the ROC AUC is computed from binned scores, the other metrics from the scores themselves
+        assert abs(metrics[name] - value) < (1e-4 if name == "test_roc_auc_score" else 1e-6), name
+
+
+def measure(name, function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{name}: {seconds:.2f}s, peak {peak / 2 ** 20:,.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--features", type=int, default=20)
+    args = parser.parse_args()
+
+    X, y = make_data(args.rows + 100000, args.features)
+    model = XGBClassifier().fit(X[:100000], y[:100000])
+    X, y = X[100000:], y[100000:]
+    print(f"{args.rows:,} rows x {args.features} features")
+
+    check_parity(model, X[:200000], y[:200000])
+
+    def score(X_chunk):
+        return model.predict_proba(X_chunk)[:, 1]
+
+    measure("previous evaluation", lambda: previous_evaluation(model, X, y))
+    measure("chunked evaluation", lambda: evaluate(score, X, y, "test"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+# =================================================
+"""
+Compares the peak memory (RSS) and time of training on arrays loaded in memory (train_model) and on memory-mapped
+arrays read in chunks (train_model_external). Each training runs in its own process, so that its peak RSS is not
+affected by the other one.
+"""
+
+
+def write_arrays(data_dir, n_rows, n_features, chunk_rows=100000, seed=0):
+    """
+    Writes synthetic train and test arrays in the layout of create_data.py, one chunk at a time.
+
+    Returns:
+        paths: the paths to the X and y arrays of the train and test sets
+    """
+    rng = np.random.default_rng(seed)
+    weights = rng.normal(size=n_features)
+    paths = {}
+    for name, rows in [("train", n_rows), ("test", n_rows // 4)]:
+        os.makedirs(os.path.join(data_dir, name), exist_ok=True)
+        X_path = os.path.join(data_dir, name, f"{name}_data_X.npy")
+        y_path = os.path.join(data_dir, name, f"{name}_data_y.npy")
+        X = np.lib.format.open_memmap(X_path, mode="w+", dtype=np.float32, shape=(rows, n_features))
+        y = np.lib.format.open_memmap(y_path, mode="w+", dtype=np.int64, shape=(rows,))
+        for start in range(0, rows, chunk_rows):
+            chunk = rng.normal(size=(min(chunk_rows, rows - start), n_features)).astype(np.float32)
+            X[start:start + len(chunk)] = chunk
+            y[start:start + len(chunk)] = (chunk @ weights + rng.normal(size=len(chunk)) > 0)
+        X.flush()
+        y.flush()
+        del X, y
+        paths[name] = (X_path, y_path)
+    return paths
+
+
+def run_training(mode, paths, chunk_rows, cache_dir):
+    from model import train_model, train_model_external
+
+    start = time.perf_counter()
+    if mode == "in_memory":
+        X_train, y_train = (np.load(path) for path in paths["train"])
+        X_test, y_test = (np.load(path) for path in paths["test"])
+        _, train_metrics, test_metrics = train_model(X_train, y_train, X_test, y_test)
+    else:
+        _, train_metrics, test_metrics = train_model_external(paths["train"], paths["test"], chunk_rows=chunk_rows,
+                                                              cache_dir=cache_dir)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"mode": mode, "seconds": seconds, "peak_rss_mb": peak_rss_mb, **train_metrics, **test_metrics}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--features", type=int, default=50)
+    parser.add_argument("--chunk_rows", type=int, default=100000)
+    parser.add_argument("--modes", type=str, nargs="+", default=["in_memory", "external_memory"],
+                        choices=["in_memory", "external_memory"])
+    parser.add_argument("--data_dir", type=str, default=None, help="where to keep the generated arrays")
+    parser.add_argument("--run", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        # child process: train once and print the result
+        paths = json.loads(args.run)
+        print(json.dumps(run_training(paths.pop("mode"), paths, args.chunk_rows, paths.pop("cache_dir"))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or tmp_dir
+        paths = write_arrays(data_dir, args.rows, args.features)
+        size_mb = sum(os.path.getsize(path) for path in paths["train"] + paths["test"]) / 2 ** 20
+        print(f"{args.rows:,} training rows x {args.features} features, {size_mb:,.0f} MB of arrays")
+
+        for mode in args.modes:
+            child_args = json.dumps(dict(paths, mode=mode, cache_dir=os.path.join(tmp_dir, "xgboost_cache")))
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", child_args,
+                                     "--chunk_rows", str(args.chunk_rows)],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode}: {result['seconds']:.1f}s, peak RSS {result['peak_rss_mb']:,.0f} MB, "
+                  f"test accuracy {result.get('test_accuracy', float('nan')):.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from sklearn.model_selection import train_test_split
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), "src"))
+
+from splits import folds, random_split, split_features  # noqa: E402
+from transform import FeatureTransform  # noqa: E402
+from transform_benchmark import make_data  # noqa: E402
+
+
+# =================================================
+"""
+Compares the peak memory and time of splitting a dataset by copying it (DataFrame.to_numpy and train_test_split)
+with the position-based splits of splits.py, in memory and memory-mapped, and of generating cross-validation folds.
+"""
+
+
+def measure(name, function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{name}: {seconds:.2f}s, peak {peak / 2 ** 20:,.0f} MB")
+
+
+def copy_split(df, feature_columns, label_column):
+    # the previous preprocessing: one numpy array of the whole DataFrame, copied again by the split
+    data = df.to_numpy()
+    X, y = data[:, :len(feature_columns)], data[:, -1]
+    return train_test_split(X, y, test_size=0.25, random_state=42)
+
+
+def position_split(df, feature_columns, label_column, memmap_path=None):
+    train_rows, test_rows = random_split(len(df), 0.25, 42)
+    transform = FeatureTransform().fit(df, feature_columns, rows=train_rows)
+    X_train, X_test = split_features(transform, df, train_rows, test_rows, memmap_path=memmap_path)
+    y = df[label_column].to_numpy()
+    return X_train, X_test, y[train_rows], y[test_rows]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--folds", type=int, default=10)
+    args = parser.parse_args()
+
+    df = make_data(args.rows)
+    df["label"] = (np.random.default_rng(0).random(args.rows) < 0.3).astype(int)
+    feature_columns = list(df.columns[:-1])
+    print(f"{args.rows:,} rows, DataFrame of {df.memory_usage(deep=True).sum() / 2 ** 20:,.0f} MB")
+
+    measure("copy split (to_numpy + train_test_split)", lambda: copy_split(df, feature_columns, "label"))
+    measure("position split, in memory", lambda: position_split(df, feature_columns, "label"))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        measure("position split, memory-mapped", lambda: position_split(
+            df, feature_columns, "label", memmap_path=os.path.join(tmp_dir, "features.npy")))
+
+    y = df["label"].to_numpy()
+    measure(f"{args.folds} stratified folds (positions only)", lambda: [len(test_rows) for _, test_rows in folds(args.folds, 0, y=y)])
+
+
+if __name__ == "__main__":
+    main()
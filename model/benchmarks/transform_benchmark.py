@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from transform import FeatureTransform  # noqa: E402
+
+
+# =================================================
+"""
+Measures the throughput of the feature transform in rows per second, for single requests and for batches.
+The parity of the training and serving paths is checked by tests/test_transform.py.
+"""
+
+
+def make_data(n_rows, seed=0):
+    """
+    Generates rows shaped like the maintenance sample data, with missing values.
+
+    Args:
+        n_rows (int): the number of rows
+        seed (int): the random seed
+    Returns:
+        df: the generated DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "heat_deviation": rng.normal(0, 2, n_rows),
+        "speed_deviation": rng.normal(1, 1.5, n_rows),
+        "assembly_line_num": rng.choice([f"assembly_{i}" for i in range(5)], n_rows),
+        "days_since_last_service": rng.poisson(100, n_rows),
+        "operator": rng.choice([f"operator{i}" for i in range(8)], n_rows),
+    })
+    df.loc[rng.random(n_rows) < 0.02, "heat_deviation"] = np.nan
+    df.loc[rng.random(n_rows) < 0.02, "operator"] = None
+    return df
+
+
+def rows_per_second(function, n_rows, min_seconds=0.5):
+    calls, start = 0, time.perf_counter()
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return calls * n_rows / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 100, 10000, 1000000])
+    args = parser.parse_args()
+
+    df = make_data(max(args.batch_sizes))
+    transform = FeatureTransform().fit(df)
+    request = df.iloc[0].to_dict()
+    print(f"single request (dict): {rows_per_second(lambda: transform.transform(request), 1):,.0f} rows/s")
+    for batch_size in args.batch_sizes:
+        batch = df.iloc[:batch_size]
+        print(f"batch of {batch_size} (DataFrame): "
+              f"{rows_per_second(lambda: transform.transform(batch), batch_size):,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
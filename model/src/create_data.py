@@ -2,11 +2,47 @@ import os
 import argparse
 import pandas as pd
 import numpy as np
+import preprocess
 from preprocess import preprocess_data
+from data_cache import PreprocessingCache, fingerprint
+from transform import FEATURE_TRANSFORM_FILE
+from instrumentation import StageProfiler
 import logging
 import mlflow
 
 
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# the source files the preprocessed arrays depend on; a change to any of them invalidates the cache
+PREPROCESSING_SOURCES = ["preprocess.py", "transform.py", "splits.py"]
+
+
+def remove_outputs(outputs):
+    """
+    Removes the outputs of a previous run, which may be hard links to a cache entry that
+    writing the new outputs in place would overwrite.
+
+    Args:
+        outputs (dict): the destination folder of each output file name
+    """
+    for name, output_dir in outputs.items():
+        path = os.path.join(output_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def save_arrays(outputs, arrays):
+    """
+    Saves the preprocessed arrays.
+
+    Args:
+        outputs (dict): the destination folder of each array file name
+        arrays (dict): the array of each array file name
+    """
+    for name, array in arrays.items():
+        np.save(os.path.join(outputs[name], name), array)
+
+
 def main():
     """Main function of the script."""
 
@@ -15,6 +51,11 @@ def main():
     parser.add_argument("--data", type=str, help="path to input data")
     parser.add_argument("--train_data", type=str, help="path to train data")
     parser.add_argument("--test_data", type=str, help="path to test data")
+    parser.add_argument("--cache_dir", type=str, default=None,
+                        help="path to the cache of preprocessed arrays, disabled if not given")
+    parser.add_argument("--cache_max_gb", type=float, default=10, help="maximum size of the cache")
+    parser.add_argument("--profile", action="store_true",
+                        help="log the time, memory and I/O of each stage to MLflow")
     args = parser.parse_args()
 
     # Start Logging
@@ -24,20 +65,49 @@ def main():
 
     print("input data:", args.data)
 
-    df = pd.read_csv(args.data, header=0)
+    profiler = StageProfiler(enabled=args.profile)
+
+    outputs = {"train_data_X.npy": args.train_data, "train_data_y.npy": args.train_data,
+               "test_data_X.npy": args.test_data, "test_data_y.npy": args.test_data,
+               FEATURE_TRANSFORM_FILE: args.train_data}
+
+    cache, key, meta = None, None, None
+    if args.cache_dir is not None:
+        cache = PreprocessingCache(args.cache_dir, max_bytes=int(args.cache_max_gb * 2 ** 30))
+        key = fingerprint(args.data, [os.path.join(SRC_DIR, name) for name in PREPROCESSING_SOURCES],
+                          {"test_size": preprocess.TEST_SIZE, "random_state": preprocess.RANDOM_STATE,
+                           "split_method": preprocess.SPLIT_METHOD, "group_column": preprocess.GROUP_COLUMN,
+                           "time_column": preprocess.TIME_COLUMN})
+        with profiler.stage("restore_cache"):
+            meta = cache.restore(key, outputs)
+        mlflow.log_param("preprocessing_cache_key", key)
+        mlflow.log_metric("preprocessing_cache_hit", int(meta is not None))
+        print("preprocessing cache", "hit:" if meta is not None else "miss:", key)
+
+    if meta is None:
+        remove_outputs(outputs)
+        with profiler.stage("read_csv"):
+            df = pd.read_csv(args.data, header=0)
+        meta = {"num_samples": df.shape[0], "num_features": df.shape[1] - 1}
+
+        # Preprocess data, saving the fitted feature transform next to the training arrays
+        with profiler.stage("preprocess"):
+            X_train, y_train, X_test, y_test = preprocess_data(
+                df, transform_path=os.path.join(args.train_data, FEATURE_TRANSFORM_FILE))
+
+        # Save the arrays
+        with profiler.stage("save_arrays"):
+            save_arrays(outputs, {"train_data_X.npy": X_train, "train_data_y.npy": y_train,
+                                  "test_data_X.npy": X_test, "test_data_y.npy": y_test})
+
+        if cache is not None:
+            with profiler.stage("store_cache"):
+                cache.store(key, outputs, meta)
 
-    mlflow.log_metric("num_samples", df.shape[0])
-    mlflow.log_metric("num_features", df.shape[1] - 1)
+    mlflow.log_metric("num_samples", meta["num_samples"])
+    mlflow.log_metric("num_features", meta["num_features"])
+    profiler.log()
 
-    # Preprocess data
-    X_train, y_train, X_test, y_test = preprocess_data(df)
-    
-    # Save the arrays
-    for path, names, arrs in [[args.train_data, ['train_data_X', 'train_data_y'], [X_train, y_train]],
-                              [args.test_data, ['test_data_X', 'test_data_y'], [X_test, y_test]]]:
-        for name, arr in zip(names, arrs):
-            np.save(os.path.join(path, name), arr)
-    
     # Stop Logging
     mlflow.end_run()
 
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+
+# =================================================
+"""
+Cache of the preprocessed arrays, keyed on a fingerprint of everything they depend on:
+the input data, the preprocessing source code and the split parameters.
+Each entry is a folder named after its fingerprint, holding the saved arrays and a meta.json file.
+"""
+
+META_FILE = "meta.json"
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def _hash_file(digest, path):
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+
+
+def fingerprint(data_path, source_paths, params):
+    """
+    Computes the cache key of a preprocessing run.
+
+    Args:
+        data_path (str): path to the input data file
+        source_paths (list of str): paths to the source files of the preprocessing
+        params (dict): the parameters of the preprocessing, e.g. the split parameters (must be JSON-serialisable)
+    Returns:
+        key: the hex digest of the data, sources and parameters
+    """
+    digest = hashlib.sha256()
+    _hash_file(digest, data_path)
+    for path in source_paths:
+        digest.update(os.path.basename(path).encode("utf-8"))
+        _hash_file(digest, path)
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _link_or_copy(source, destination):
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        # hard links are not available across file systems, or on some mounted datastores
+        shutil.copy2(source, destination)
+
+
+def _entry_size(entry_dir):
+    return sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+
+
+class PreprocessingCache:
+    """
+    Stores the preprocessed arrays of previous runs and restores them, by hard link when possible, when the input
+    data, the preprocessing code and the parameters are unchanged. Once the entries take up more than max_bytes,
+    the least recently used entries are evicted.
+
+    Args:
+        cache_dir (str): path to the cache folder
+        max_bytes (int): the maximum total size of the entries
+    """
+
+    def __init__(self, cache_dir, max_bytes=10 * 2 ** 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def restore(self, key, outputs):
+        """
+        Restores the files of a cache entry, if there is one.
+
+        Args:
+            key (str): the fingerprint of the run
+            outputs (dict): the destination folder of each file name, e.g. {"train_data_X.npy": "<path>"}
+        Returns:
+            meta: the metadata stored with the entry, or None on a cache miss
+        """
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        files = meta.get("files")
+        if files is None or not all(name in outputs and os.path.exists(os.path.join(entry_dir, name)) for name in files):
+            return None
+
+        for name in files:
+            _link_or_copy(os.path.join(entry_dir, name), os.path.join(outputs[name], name))
+        # the modification time of meta.json records when the entry was last used
+        os.utime(meta_path)
+        return meta
+
+    def store(self, key, outputs, meta):
+        """
+        Adds the files of a run to the cache, then evicts the least recently used entries beyond max_bytes.
+        Output files the run did not write are left out of the entry.
+
+        Args:
+            key (str): the fingerprint of the run
+            outputs (dict): the folder each file was saved to, e.g. {"train_data_X.npy": "<path>"}
+            meta (dict): metadata to store with the entry, e.g. the number of samples
+        """
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+
+        # the entry is built under a temporary name, so that an interrupted run never leaves a partial entry
+        temporary_dir = os.path.join(self.cache_dir, f".{key}.{uuid.uuid4().hex[:8]}")
+        os.makedirs(temporary_dir)
+        files = [name for name, output_dir in outputs.items() if os.path.exists(os.path.join(output_dir, name))]
+        for name in files:
+            _link_or_copy(os.path.join(outputs[name], name), os.path.join(temporary_dir, name))
+        with open(os.path.join(temporary_dir, META_FILE), "w") as f:
+            json.dump(dict(meta, key=key, files=files, created=time.time()), f)
+        try:
+            os.rename(temporary_dir, entry_dir)
+        except OSError:
+            # another run stored the same entry in the meantime
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used entries until the cache is no larger than max_bytes.
+
+        Args:
+            keep (str) [OPTIONAL]: the fingerprint of an entry never to evict, e.g. the one just stored
+        Returns:
+            evicted: the fingerprints of the removed entries
+        """
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            meta_path = os.path.join(self._entry_dir(key), META_FILE)
+            if key.startswith(".") or not os.path.exists(meta_path):
+                continue
+            entries.append((os.path.getmtime(meta_path), key, _entry_size(self._entry_dir(key))))
+
+        total = sum(size for _, _, size in entries)
+        evicted = []
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
+            evicted.append(key)
+        return evicted
@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+# =================================================
+"""
+INTRODUCTION
+This file evaluates a binary classifier in a single pass over the data, in chunks of rows.
+
+The probabilities of each chunk are computed once and folded into running totals: the confusion matrix at the
+decision threshold, the sums behind the calibration metrics, and the number of positive and negative rows in each of
+AUC_BINS equal-width probability bins, from which the ROC AUC is computed. None of them grows with the number of
+rows, so the arrays can be memory-mapped and the memory used only depends on the chunk size.
+
+Scores that fall in the same of the 2^16 bins (1.5e-5 wide) are counted as ties, so the ROC AUC can only differ from
+the exact one by half the fraction of positive and negative pairs whose scores are that close.
+
+The chunks are predicted one after the other on the calling thread, since XGBoost already uses all the cores to
+predict each chunk, while the metrics of a chunk are accumulated on a second thread during the prediction of the
+next one.
+"""
+
+CHUNK_ROWS = 100000
+CALIBRATION_BINS = 10
+AUC_BINS = 2 ** 16
+EPSILON = 1e-15
+
+
+class BinaryMetrics:
+    """
+    Running totals of the metrics of a binary classifier, updated one chunk of rows at a time.
+
+    Args:
+        threshold (float) [OPTIONAL]: the score from which a row is predicted positive
+        calibration_bins (int) [OPTIONAL]: the number of equal-width probability bins of the expected calibration
+            error
+        auc_bins (int) [OPTIONAL]: the number of equal-width probability bins of the ROC AUC, scores in the same
+            bin being counted as ties
+    """
+
+    def __init__(self, threshold=0.5, calibration_bins=CALIBRATION_BINS, auc_bins=AUC_BINS):
+        self.threshold = threshold
+        self.confusion = np.zeros((2, 2), dtype=np.int64)
+        self.calibration = np.zeros((3, calibration_bins), dtype=np.float64)
+        self.squared_error = 0.0
+        self.log_loss = 0.0
+        # the number of negative and positive rows of each score bin
+        self.auc_counts = np.zeros((auc_bins, 2), dtype=np.int64)
+
+    def update(self, y_true, y_score):
+        """
+        Adds a chunk of rows to the totals.
+
+        Args:
+            y_true (numpy array): the labels of the rows, 0 or 1
+            y_score (numpy array): the predicted probabilities of the positive class
+        """
+        y_true = np.asarray(y_true).ravel().astype(np.int64)
+        y_score = np.asarray(y_score).ravel()
+        if len(y_true) != len(y_score):
+            raise ValueError(f"Got {len(y_true)} labels for {len(y_score)} scores")
+        y_score = y_score.astype(np.float64)
+
+        y_pred = (y_score >= self.threshold).astype(np.int64)
+        self.confusion += np.bincount(2 * y_true + y_pred, minlength=4).reshape(2, 2)
+
+        calibration_bins = self.calibration.shape[1]
+        bins = np.minimum((y_score * calibration_bins).astype(np.int64), calibration_bins - 1)
+        self.calibration[0] += np.bincount(bins, minlength=calibration_bins)
+        self.calibration[1] += np.bincount(bins, weights=y_score, minlength=calibration_bins)
+        self.calibration[2] += np.bincount(bins, weights=y_true, minlength=calibration_bins)
+
+        auc_bins = self.auc_counts.shape[0]
+        bins = np.minimum((np.clip(y_score, 0, 1) * auc_bins).astype(np.int64), auc_bins - 1)
+        self.auc_counts += np.bincount(2 * bins + y_true, minlength=2 * auc_bins).reshape(auc_bins, 2)
+
+        clipped = np.clip(y_score, EPSILON, 1 - EPSILON)
+        self.squared_error += float(np.sum((y_score - y_true) ** 2))
+        self.log_loss -= float(np.sum(np.where(y_true == 1, np.log(clipped), np.log1p(-clipped))))
+
+    def roc_auc(self):
+        """The area under the ROC curve of the binned scores, None if the rows are all of one class."""
+        negatives, positives = self.auc_counts[:, 0].astype(np.float64), self.auc_counts[:, 1].astype(np.float64)
+        if positives.sum() == 0 or negatives.sum() == 0:
+            return None
+        # each positive ranks above the negatives of the lower bins, and ties with half of those of its bin
+        negatives_below = np.cumsum(negatives) - negatives
+        return float(np.sum(positives * (negatives_below + 0.5 * negatives)) / (positives.sum() * negatives.sum()))
+
+    def result(self, prefix):
+        """
+        Computes the metrics from the totals.
+
+        Args:
+            prefix (str): the prefix of the metric names, e.g. "test"
+        Returns:
+            metrics: a dictionary of metric names and values
+        """
+        (tn, fp), (fn, tp) = self.confusion.tolist()
+        n_rows = tn + fp + fn + tp
+        if n_rows == 0:
+            return {}
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        counts, score_sums, label_sums = self.calibration
+
+        metrics = {f"{prefix}_accuracy": (tp + tn) / n_rows,
+                   f"{prefix}_precision": precision,
+                   f"{prefix}_recall": recall,
+                   f"{prefix}_f1_score": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+                   f"{prefix}_brier_score": self.squared_error / n_rows,
+                   f"{prefix}_log_loss": self.log_loss / n_rows,
+                   f"{prefix}_expected_calibration_error": float(np.sum(np.abs(score_sums - label_sums)) / n_rows)}
+        roc_auc = self.roc_auc()
+        if roc_auc is not None:
+            metrics[f"{prefix}_roc_auc_score"] = roc_auc
+        return metrics
+
+
+def evaluate(score, X, y, prefix, chunk_rows=CHUNK_ROWS, threshold=0.5):
+    """
+    Evaluates a binary classifier in one pass over the rows: each chunk is scored on the calling thread while the
+    metrics of the previous chunk are accumulated on a second thread.
+
+    Args:
+        score (callable): returns the predicted probabilities of the positive class of a chunk of rows, e.g.
+            lambda X: model.predict_proba(X)[:, 1]
+        X (numpy array): the data, e.g. memory-mapped
+        y (numpy array): the labels, 0 or 1
+        prefix (str): the prefix of the metric names, e.g. "test"
+        chunk_rows (int) [OPTIONAL]: the number of rows scored at a time
+        threshold (float) [OPTIONAL]: the score from which a row is predicted positive
+    Returns:
+        metrics: accuracy, precision, recall, f1_score, roc_auc_score, brier_score, log_loss and
+            expected_calibration_error, prefixed with prefix
+    """
+    totals = BinaryMetrics(threshold)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = None
+        for start in range(0, len(X), chunk_rows):
+            stop = start + chunk_rows
+            y_score = score(np.asarray(X[start:stop]))
+            # at most one chunk waits to be accumulated, so no more than two chunks are in flight
+            if pending is not None:
+                pending.result()
+            pending = executor.submit(totals.update, y[start:stop], y_score)
+        if pending is not None:
+            pending.result()
+    return totals.result(prefix)
@@ -0,0 +1,81 @@
+import os
+import numpy as np
+import xgboost
+
+
+# =================================================
+"""
+Helpers to train XGBoost models on the saved .npy arrays without loading them in memory.
+
+The arrays are memory-mapped, and handed to XGBoost one chunk of rows at a time through a data iterator: XGBoost
+builds its quantile histograms from the chunks, and keeps the binned data in a cache on disk, so neither the raw
+matrix nor XGBoost's own copy of it is ever fully in memory.
+"""
+
+
+def open_array(path):
+    """
+    Memory-maps a saved array.
+
+    Args:
+        path (str): path to the .npy file
+    Returns:
+        array: the memory-mapped array, or None if the file holds no array (e.g. X_test was None)
+    """
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # arrays of Python objects cannot be memory-mapped; the only one saved by create_data is None
+        array = np.load(path, allow_pickle=True)
+        if array.ndim == 0 and array.item() is None:
+            return None
+        raise
+
+
+class ChunkIterator(xgboost.DataIter):
+    """
+    Feeds memory-mapped arrays to XGBoost one chunk of rows at a time.
+
+    Args:
+        X, y (numpy array): the features and labels, e.g. memory-mapped
+        chunk_rows (int): the number of rows passed to XGBoost at a time
+        cache_prefix (str): path prefix of the cache files XGBoost writes the binned data to
+    """
+
+    def __init__(self, X, y, chunk_rows, cache_prefix):
+        self.X = X
+        self.y = y
+        self.chunk_rows = chunk_rows
+        self._start = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._start >= len(self.X):
+            return False
+        stop = self._start + self.chunk_rows
+        input_data(data=np.asarray(self.X[self._start:stop]), label=np.asarray(self.y[self._start:stop]))
+        self._start = stop
+        return True
+
+    def reset(self):
+        self._start = 0
+
+
+def external_memory_matrix(X, y, chunk_rows, cache_dir, max_bin=256):
+    """
+    Builds an XGBoost matrix from chunks of the arrays, with the binned data cached on disk.
+
+    Args:
+        X, y (numpy array): the features and labels, e.g. memory-mapped
+        chunk_rows (int): the number of rows passed to XGBoost at a time
+        cache_dir (str): the folder of the cache files
+        max_bin (int): the number of histogram bins of each feature
+    Returns:
+        dtrain: the XGBoost matrix
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    iterator = ChunkIterator(X, y, chunk_rows, cache_prefix=os.path.join(cache_dir, "xgboost"))
+    if hasattr(xgboost, "ExtMemQuantileDMatrix"):
+        return xgboost.ExtMemQuantileDMatrix(iterator, max_bin=max_bin)
+    # XGBoost < 3.0: the iterator and cache_prefix make a DMatrix use external memory
+    return xgboost.DMatrix(iterator)
@@ -0,0 +1,132 @@
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+import mlflow
+
+
+# =================================================
+"""
+INTRODUCTION
+This file measures the stages of the pipeline scripts (reading the csv file, preprocessing, saving and loading the
+arrays, fitting, logging the model...), so that a slow run shows which stage is to blame.
+
+Each stage records its wall time, CPU time (of all the threads of the process), peak resident memory and the bytes
+read and written. The memory and I/O counters come from /proc on Linux; on other systems the peak memory is the
+peak of the whole process so far and the I/O counters are left out. When the profiler is disabled, stages do
+nothing but run their code.
+"""
+
+PROFILE_FILE = "stage_profile.json"
+
+
+def _read_io():
+    # rchar and wchar count the bytes passed through read and write calls, whether or not they reached the disk;
+    # pages of memory-mapped files are not included
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(":") for line in f)
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _reset_peak_rss():
+    # writing 5 to clear_refs resets the peak resident memory (VmHWM) of the process to its current value
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+class StageProfiler:
+    """
+    Records the resources used by the named stages of a script, e.g.
+
+        profiler = StageProfiler()
+        with profiler.stage("read_csv"):
+            df = pd.read_csv(path)
+        profiler.log()
+
+    Stages can be nested: the peak memory of a stage is the maximum of its own peak and of the peaks of the stages
+    inside it, while the times and bytes of the inner stages are also counted in the enclosing stage.
+
+    Args:
+        enabled (bool) [OPTIONAL]: whether to measure the stages, if False stage() and log() do nothing
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = []
+        self._open_peaks = []
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measures the code run inside the with block as the stage name.
+
+        Args:
+            name (str): the name of the stage, used in the MLflow metric names
+        """
+        if not self.enabled:
+            yield
+            return
+
+        io_start = _read_io()
+        if self._open_peaks:
+            # the peak of the enclosing stage so far, which resetting the peak for this stage would lose
+            self._open_peaks[-1] = max(self._open_peaks[-1], _peak_rss_mb())
+        peak_is_reset = _reset_peak_rss()
+        self._open_peaks.append(0.0)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            io_end = _read_io()
+            # the stages inside this one reset the peak, so the peaks recorded before and during them are included
+            peak = max(_peak_rss_mb(), self._open_peaks.pop())
+            if self._open_peaks:
+                self._open_peaks[-1] = max(self._open_peaks[-1], peak)
+
+            record = {"stage": name, "wall_seconds": wall, "cpu_seconds": cpu, "peak_rss_mb": peak,
+                      "peak_rss_of_stage": peak_is_reset}
+            if io_start is not None and io_end is not None:
+                record["read_bytes"] = io_end[0] - io_start[0]
+                record["written_bytes"] = io_end[1] - io_start[1]
+            self.stages.append(record)
+            print(f"stage {name}: {wall:.2f}s wall, {cpu:.2f}s cpu, {peak:.0f} MB peak RSS")
+
+    def log(self, artifact_file=PROFILE_FILE):
+        """
+        Logs the measurements to the active MLflow run: one metric per stage and measure (e.g.
+        stage_read_csv_wall_seconds), and all the records as a JSON artifact.
+
+        Args:
+            artifact_file (str) [OPTIONAL]: the name of the JSON artifact
+        """
+        if not self.enabled or not self.stages:
+            return
+        metrics = {}
+        for record in self.stages:
+            for key, value in record.items():
+                if key not in ("stage", "peak_rss_of_stage"):
+                    metrics[f"stage_{record['stage']}_{key}"] = value
+        mlflow.log_metrics(metrics)
+        mlflow.log_text(json.dumps({"stages": self.stages}, indent=2), artifact_file)
@@ -1,5 +1,11 @@
+import os
+import shutil
+import tempfile
+import xgboost
 from xgboost import XGBClassifier
-from sklearn.metrics import accuracy_score, roc_auc_score
+from evaluation import evaluate
+from instrumentation import StageProfiler
+from external_memory import external_memory_matrix, open_array
 
 
 # =================================================
@@ -14,7 +20,7 @@ The function name MUST be left as train_model, and should NOT be changed.
 """
 
 
-def train_model(X_train, y_train, X_test=None, y_test=None):
+def train_model(X_train, y_train, X_test=None, y_test=None, profiler=None):
     """
     YOUR TRAINING SCRIPT GOES HERE
 
@@ -23,6 +29,7 @@ def train_model(X_train, y_train, X_test=None, y_test=None):
         y_train (numpy array): training labels as a numpy array
         X_test (numpy array) [OPTIONAL]: testing data as a numpy array
         y_test (numpy array) [OPTIONAL]: testing data as a numpy array
+        profiler (StageProfiler) [OPTIONAL]: measures the fit and evaluate stages (see instrumentation.py)
     Returns:
         model: fitted model
         train_metrics: training metrics
@@ -30,26 +37,26 @@ def train_model(X_train, y_train, X_test=None, y_test=None):
     """
 
     # Example script
+    profiler = profiler or StageProfiler(enabled=False)
 
     # Define the model
     model = XGBClassifier()
 
     # Fit the model
-    model.fit(X_train, y_train)
+    with profiler.stage("fit"):
+        model.fit(X_train, y_train)
 
-    # Evaluate the model
-    y_train_pred = model.predict(X_train)
-    if X_test != None:
-        y_test_pred = model.predict(X_test)
+    # Evaluate the model, in chunks scored across threads (see evaluation.py)
+    def score(X):
+        return model.predict_proba(X)[:, 1]
 
-    train_metrics = {'train_accuracy': accuracy_score(y_train, y_train_pred),
-                     'train_roc_auc_score': roc_auc_score(y_train, y_train_pred)}
+    with profiler.stage("evaluate"):
+        train_metrics = evaluate(score, X_train, y_train, 'train')
 
-    if X_test != None:
-        test_metrics = {'test_accuracy': accuracy_score(y_test, y_test_pred),
-                        'test_roc_auc_score': roc_auc_score(y_test, y_test_pred)}
-    else:
-        test_metrics = {}
+        if X_test is not None:
+            test_metrics = evaluate(score, X_test, y_test, 'test')
+        else:
+            test_metrics = {}
 
     """
     Your function MUST return, in the following order:
@@ -59,3 +66,50 @@ def train_model(X_train, y_train, X_test=None, y_test=None):
     """
 
     return model, train_metrics, test_metrics
+
+
+def train_model_external(train_paths, test_paths=None, chunk_rows=100000, cache_dir=None, profiler=None):
+    """
+    Trains the example model of train_model on arrays saved on disk, without loading them in memory:
+    the arrays are memory-mapped and passed to XGBoost in chunks of rows (see external_memory.py).
+    Use it when the training data does not fit in memory.
+
+    Args:
+        train_paths (tuple of str): paths to the training data and labels .npy files
+        test_paths (tuple of str) [OPTIONAL]: paths to the testing data and labels .npy files
+        chunk_rows (int): the number of rows read at a time
+        cache_dir (str) [OPTIONAL]: the scratch folder XGBoost caches the binned training data in, by default the
+            system temporary folder; the cache is written to a new subfolder, removed once the model is evaluated
+        profiler (StageProfiler) [OPTIONAL]: measures the fit and evaluate stages (see instrumentation.py)
+    Returns:
+        model: fitted model (an XGBoost Booster)
+        train_metrics: training metrics
+        test_metrics: testing metrics
+    """
+    profiler = profiler or StageProfiler(enabled=False)
+    X_train, y_train = (open_array(path) for path in train_paths)
+
+    # the cache is as large as the binned training data, so it must not be left behind, e.g. in ./outputs
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+    scratch_dir = tempfile.mkdtemp(prefix="xgboost_cache_", dir=cache_dir)
+    try:
+        # the same model as XGBClassifier(), with quantile-based histograms built chunk by chunk
+        params = {"objective": "binary:logistic", "tree_method": "hist", "max_bin": 256}
+        with profiler.stage("fit"):
+            dtrain = external_memory_matrix(X_train, y_train, chunk_rows, scratch_dir, max_bin=params["max_bin"])
+            model = xgboost.train(params, dtrain, num_boost_round=100)
+            del dtrain
+
+        with profiler.stage("evaluate"):
+            train_metrics = evaluate(model.inplace_predict, X_train, y_train, 'train', chunk_rows=chunk_rows)
+
+            test_metrics = {}
+            if test_paths is not None:
+                X_test, y_test = (open_array(path) for path in test_paths)
+                if X_test is not None:
+                    test_metrics = evaluate(model.inplace_predict, X_test, y_test, 'test', chunk_rows=chunk_rows)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    return model, train_metrics, test_metrics
@@ -1,4 +1,15 @@
-from sklearn.model_selection import train_test_split
+from transform import FeatureTransform
+from splits import split_features, train_test_rows
+
+
+# Split parameters, also part of the cache key of the preprocessed arrays (see create_data.py)
+# SPLIT_METHOD is one of "random", "stratified" (on the label), "group" (on GROUP_COLUMN, e.g. the patient ID)
+# or "time" (on TIME_COLUMN, the latest rows being used for testing)
+TEST_SIZE = 0.25
+RANDOM_STATE = 42
+SPLIT_METHOD = "random"
+GROUP_COLUMN = None
+TIME_COLUMN = None
 
 
 # =================================================
@@ -10,14 +21,18 @@ The function takes a Pandas DataFrame as its input, and MUST return two or four
 and the option to return testing inputs and testing labels.
 
 The function name MUST be left as preprocess_data(), and should NOT be changed.
+
+The features should be computed by a FeatureTransform (see transform.py) fitted on the training data: it is saved to
+transform_path, stored with the model, and applied again to the requests by the serving endpoint.
 """
 
 
-def preprocess_data(df):
+def preprocess_data(df, transform_path=None):
     """
     YOUR TRAINING SCRIPT GOES HERE
     Args:
         df (Pandas DataFrame): 
+        transform_path (str) [OPTIONAL]: path to save the fitted feature transform to
     Returns:
         X_train: a numpy array for training data e.g., shape (samples, features) or (samples, timesteps, features)
         y_train: a numpy array for training labels e.g., shape (samples) or (samples, 1)
@@ -29,9 +44,20 @@ def preprocess_data(df):
 
     # Example script
 
-    data = df.to_numpy()
-    X, y = data[:, :5], data[:, -1]
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_split=0.25, random_state=42)
+    feature_columns, label_column = list(df.columns[:5]), df.columns[-1]
+
+    # the split only produces row positions: the DataFrame is not copied, and keeps its column dtypes
+    train_rows, test_rows = train_test_rows(df, SPLIT_METHOD, TEST_SIZE, RANDOM_STATE, label_column=label_column,
+                                            group_column=GROUP_COLUMN, time_column=TIME_COLUMN)
+
+    # the transform is fitted on the training rows only, then the features of both sets are computed at once
+    transform = FeatureTransform().fit(df, feature_columns, rows=train_rows)
+    if transform_path is not None:
+        transform.save(transform_path)
+
+    X_train, X_test = split_features(transform, df, train_rows, test_rows)
+    y = df[label_column].to_numpy()
+    y_train, y_test = y[train_rows], y[test_rows]
 
     """
     Your function MUST return, in the following order:
@@ -0,0 +1,185 @@
+import numpy as np
+from sklearn.model_selection import (GroupKFold, GroupShuffleSplit, KFold, ShuffleSplit, StratifiedGroupKFold,
+                                     StratifiedKFold, StratifiedShuffleSplit)
+
+
+# =================================================
+"""
+INTRODUCTION
+This file provides the train/test splits and cross-validation folds of the preprocessing, as arrays of row positions.
+
+Splitting positions rather than data means the DataFrame is never copied or converted to a single numpy array,
+so every column keeps its own dtype until the feature transform reads it. The features of a split are then written
+once, in split order, so that the training and testing sets are contiguous views of the same array - which can also
+be a memory-mapped file, for datasets larger than memory. Many folds can be generated from the same DataFrame at the
+cost of their position arrays only.
+"""
+
+SPLIT_METHODS = ["random", "stratified", "group", "time"]
+
+
+def _positions(n_rows):
+    # the splitters only use the length of X, so no data is passed to them
+    return np.empty((n_rows, 0))
+
+
+def random_split(n_rows, test_size, random_state):
+    """
+    Splits the rows at random, exactly as sklearn's train_test_split does.
+
+    Args:
+        n_rows (int): the number of rows
+        test_size (float): the fraction of the rows in the testing set
+        random_state (int): the random seed
+    Returns:
+        train_rows, test_rows: the positions of the training and testing rows
+    """
+    return next(ShuffleSplit(n_splits=1, test_size=test_size, random_state=random_state).split(_positions(n_rows)))
+
+
+def stratified_split(y, test_size, random_state):
+    """
+    Splits the rows at random, keeping the proportion of each label the same in both sets.
+
+    Args:
+        y (numpy array): the labels
+        test_size (float): the fraction of the rows in the testing set
+        random_state (int): the random seed
+    Returns:
+        train_rows, test_rows: the positions of the training and testing rows
+    """
+    splitter = StratifiedShuffleSplit(n_splits=1, test_size=test_size, random_state=random_state)
+    return next(splitter.split(_positions(len(y)), y))
+
+
+def group_split(groups, test_size, random_state):
+    """
+    Splits the groups at random, so that all the rows of a group (e.g. of a patient) are in the same set.
+
+    Args:
+        groups (numpy array): the group of each row
+        test_size (float): the fraction of the groups in the testing set
+        random_state (int): the random seed
+    Returns:
+        train_rows, test_rows: the positions of the training and testing rows
+    """
+    splitter = GroupShuffleSplit(n_splits=1, test_size=test_size, random_state=random_state)
+    return next(splitter.split(_positions(len(groups)), groups=groups))
+
+
+def _time_boundary(sorted_times, position):
+    # moves a boundary between two rows of the same time to the first row with a later time, so that all the rows of
+    # a time are on the same side of it
+    if position <= 0 or position >= len(sorted_times):
+        return position
+    return int(np.searchsorted(sorted_times, sorted_times[position - 1], side="right"))
+
+
+def time_split(times, test_size):
+    """
+    Puts the latest rows in the testing set, so that the model is evaluated on data from after its training data.
+    All the rows of a time are in the same set: the testing set starts at the first row with a new time after the
+    requested size, or holds the whole latest time if more than test_size of the rows share it. Rows with the same
+    time are kept in their original order.
+
+    Args:
+        times (numpy array): the time of each row, e.g. the admission date
+        test_size (float): the fraction of the rows in the testing set
+    Returns:
+        train_rows, test_rows: the positions of the training and testing rows, in time order
+    """
+    order = np.argsort(times, kind="stable")
+    sorted_times = np.asarray(times)[order]
+    n_train = _time_boundary(sorted_times, len(order) - int(np.ceil(test_size * len(order))))
+    if n_train == len(order) and len(order) > 0:
+        n_train = int(np.searchsorted(sorted_times, sorted_times[-1], side="left"))
+    if n_train == 0:
+        raise ValueError("All the rows have the same time, they cannot be split on time")
+    return order[:n_train], order[n_train:]
+
+
+def train_test_rows(df, method, test_size, random_state, label_column=None, group_column=None, time_column=None):
+    """
+    Splits the rows of a DataFrame with one of the SPLIT_METHODS.
+
+    Args:
+        df (Pandas DataFrame): the data
+        method (str): "random", "stratified" (on label_column), "group" (on group_column) or "time" (on time_column)
+        test_size (float): the fraction of the rows (of the groups for a group split) in the testing set
+        random_state (int): the random seed
+        label_column, group_column, time_column (str) [OPTIONAL]: the columns the split depends on
+    Returns:
+        train_rows, test_rows: the positions of the training and testing rows
+    """
+    if method == "random":
+        return random_split(len(df), test_size, random_state)
+    if method == "stratified":
+        return stratified_split(df[label_column].to_numpy(), test_size, random_state)
+    if method == "group":
+        return group_split(df[group_column].to_numpy(), test_size, random_state)
+    if method == "time":
+        return time_split(df[time_column].to_numpy(), test_size)
+    raise ValueError(f"Unknown split method {method}, expected one of {SPLIT_METHODS}")
+
+
+def folds(n_splits, random_state=None, y=None, groups=None, times=None, n_rows=None):
+    """
+    Generates cross-validation folds as positions, without copying any data. The folds are stratified if y is
+    given, grouped if groups are given (and stratified too if both are), and expanding time windows if times are
+    given: each fold is then tested on the rows following its training rows, up to the latest row, and all the rows of
+    a time are in the same testing fold.
+
+    Args:
+        n_splits (int): the number of folds
+        random_state (int) [OPTIONAL]: the random seed of the shuffling, unused for time folds
+        y (numpy array) [OPTIONAL]: the labels to stratify on
+        groups (numpy array) [OPTIONAL]: the group of each row
+        times (numpy array) [OPTIONAL]: the time of each row
+        n_rows (int) [OPTIONAL]: the number of rows, when none of y, groups and times is given
+    Returns:
+        folds: a generator of (train_rows, test_rows) pairs
+    """
+    if times is not None:
+        order = np.argsort(times, kind="stable")
+        sorted_times = np.asarray(times)[order]
+        # the testing folds cover the latest rows, as in sklearn's TimeSeriesSplit: the rows left over by the
+        # division go to the first training set
+        fold_size = len(order) // (n_splits + 1)
+        starts = [_time_boundary(sorted_times, len(order) - (n_splits - i) * fold_size) for i in range(n_splits)]
+        starts.append(len(order))
+        if fold_size == 0 or any(start >= end for start, end in zip(starts, starts[1:])):
+            raise ValueError(f"Too few distinct times for {n_splits} time folds")
+        return ((order[:start], order[start:end]) for start, end in zip(starts, starts[1:]))
+
+    if n_rows is None:
+        n_rows = len(y if y is not None else groups)
+    shuffle = dict(shuffle=True, random_state=random_state)
+    if groups is not None and y is not None:
+        return StratifiedGroupKFold(n_splits, **shuffle).split(_positions(n_rows), y, groups)
+    if groups is not None:
+        return GroupKFold(n_splits).split(_positions(n_rows), groups=groups)
+    if y is not None:
+        return StratifiedKFold(n_splits, **shuffle).split(_positions(n_rows), y)
+    return KFold(n_splits, **shuffle).split(_positions(n_rows))
+
+
+def split_features(transform, df, train_rows, test_rows, memmap_path=None):
+    """
+    Computes the features of a split in a single array, the training rows first, and returns the training and
+    testing sets as contiguous views of it. Only one column of the DataFrame is copied at a time.
+
+    Args:
+        transform (FeatureTransform): the fitted feature transform
+        df (Pandas DataFrame): the data
+        train_rows, test_rows (numpy array): the positions of the training and testing rows
+        memmap_path (str) [OPTIONAL]: path to a .npy file to write the features to instead of memory
+    Returns:
+        X_train, X_test: the features of the training and testing rows
+    """
+    order = np.concatenate([train_rows, test_rows])
+    out = None
+    if memmap_path is not None:
+        out = np.lib.format.open_memmap(memmap_path, mode="w+", dtype=np.float32,
+                                        shape=(len(order), transform.num_features))
+    X = transform.transform(df, rows=order, out=out)
+    return X[:len(train_rows)], X[len(train_rows):]
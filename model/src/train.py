@@ -1,9 +1,12 @@
 import argparse
+import shutil
 from sklearn.metrics import classification_report, accuracy_score, roc_auc_score, f1_score
 import os
 import numpy as np
 import mlflow
-from model import train_model
+from model import train_model, train_model_external
+from transform import FEATURE_TRANSFORM_FILE
+from instrumentation import StageProfiler
 
 
 # =================================================
@@ -31,29 +34,41 @@ your model-training script.
 
 def main():
 
-    def load_files(path):
+    def find_files(path):
         """
-        This function provides the path to the training or testing files.
-        It assumes the only files in the directory are the X and y arrays, in that order.
+        This function provides the paths to the training or testing files.
+        It assumes the only .npy files in the directory are the X and y arrays;
+        other files, such as the feature transform, are ignored.
 
         Args:
             path (str): path to the parent directory
         Returns:
-            X, y: two numpy arrays
+            X_path, y_path: the paths to the two numpy arrays
         """
-        files = os.listdir(path)
-        
-        arrays = {}
+        files = [file for file in os.listdir(path) if file.endswith('.npy')]
+
+        paths = {}
         for file in files:
-            arr = np.load(os.path.join(path, file))
             if 'X' in file:
-                arrays['X'] = arr
+                paths['X'] = os.path.join(path, file)
             elif 'y' in file.replace('.npy', ''):
-                arrays['y'] = arr
+                paths['y'] = os.path.join(path, file)
             else:
                 raise KeyError(f"Failure to load either the X or y arrays - Encountered file {file}.")
-        
-        return arrays['X'], arrays['y']
+
+        return paths['X'], paths['y']
+
+    def load_files(path):
+        """
+        This function loads the training or testing files.
+
+        Args:
+            path (str): path to the parent directory
+        Returns:
+            X, y: two numpy arrays
+        """
+        X_path, y_path = find_files(path)
+        return np.load(X_path), np.load(y_path)
 
     # input and output arguments
     parser = argparse.ArgumentParser()
@@ -61,14 +76,31 @@ def main():
     parser.add_argument("--test_data", type=str, help="path to test data")
     parser.add_argument("--registered_model_name", type=str, help="model name")
     parser.add_argument("--model", type=str, help="path to model file")
+    parser.add_argument("--external_memory", action="store_true",
+                        help="train on the arrays in chunks, without loading them in memory")
+    parser.add_argument("--chunk_rows", type=int, default=100000, help="rows read at a time with --external_memory")
+    parser.add_argument("--cache_dir", type=str, default=None,
+                        help="scratch folder of the XGBoost cache with --external_memory, the temporary folder "
+                             "by default; keep it out of ./outputs, which is uploaded with the run")
+    parser.add_argument("--profile", action="store_true",
+                        help="log the time, memory and I/O of each stage to MLflow")
     args = parser.parse_args()
 
-    # Locate the training/testing data
-    X_train, y_train = load_files(args.train_data)
-    X_test, y_test = load_files(args.test_data)
+    profiler = StageProfiler(enabled=args.profile)
+
+    if args.external_memory:
+        print('Beginning training from external memory...')
+        model, train_metrics, test_metrics = train_model_external(
+            find_files(args.train_data), find_files(args.test_data), chunk_rows=args.chunk_rows,
+            cache_dir=args.cache_dir, profiler=profiler)
+    else:
+        # Locate the training/testing data
+        with profiler.stage("load_arrays"):
+            X_train, y_train = load_files(args.train_data)
+            X_test, y_test = load_files(args.test_data)
 
-    print('Beginning training...')
-    model, train_metrics, test_metrics = train_model(X_train, y_train, X_test, y_test)
+        print('Beginning training...')
+        model, train_metrics, test_metrics = train_model(X_train, y_train, X_test, y_test, profiler=profiler)
 
     # Log the output from the training process
     mlflow.log_metrics(train_metrics)
@@ -76,17 +108,38 @@ def main():
 
     # Registering the model to the workspace
     print("Registering the model via MLFlow")
-    mlflow.sklearn.log_model(
-        sk_model=model,
-        registered_model_name=args.registered_model_name,
-        artifact_path=args.registered_model_name,
-    )
-
-    # Saving the model to a file
-    mlflow.sklearn.save_model(
-        sk_model=model,
-        path=os.path.join(args.model, "trained_model"),
-    )
+    with profiler.stage("log_model"):
+        if args.external_memory:
+            # external memory training returns an XGBoost Booster rather than a scikit-learn model
+            mlflow.xgboost.log_model(
+                xgb_model=model,
+                registered_model_name=args.registered_model_name,
+                artifact_path=args.registered_model_name,
+            )
+            mlflow.xgboost.save_model(
+                xgb_model=model,
+                path=os.path.join(args.model, "trained_model"),
+            )
+        else:
+            mlflow.sklearn.log_model(
+                sk_model=model,
+                registered_model_name=args.registered_model_name,
+                artifact_path=args.registered_model_name,
+            )
+
+            # Saving the model to a file
+            mlflow.sklearn.save_model(
+                sk_model=model,
+                path=os.path.join(args.model, "trained_model"),
+            )
+
+    # Storing the feature transform with the model, so that the serving endpoint applies the same transformation
+    transform_path = os.path.join(args.train_data, FEATURE_TRANSFORM_FILE)
+    if os.path.exists(transform_path):
+        mlflow.log_artifact(transform_path, artifact_path=args.registered_model_name)
+        shutil.copy(transform_path, os.path.join(args.model, "trained_model", FEATURE_TRANSFORM_FILE))
+
+    profiler.log()
 
     # Stop Logging
     mlflow.end_run()
@@ -0,0 +1,209 @@
+import json
+import numpy as np
+
+
+# =================================================
+"""
+INTRODUCTION
+This file holds the feature transformation shared by training and serving.
+
+The transform is fitted once on the training data, saved as a JSON file next to the model, and loaded again by the
+serving endpoint, so that the model always sees the same features. It only depends on numpy, and every column is
+transformed as a whole with numpy operations, whether the input is a training DataFrame or a single request.
+"""
+
+FEATURE_TRANSFORM_FILE = "feature_transform.json"
+
+
+def _is_missing(value):
+    return value is None or value != value
+
+
+class FeatureTransform:
+    """
+    Turns raw rows into a float32 feature matrix:
+    - numeric columns are cast to float32, missing values being replaced by the median of the training data
+    - categorical columns are one-hot encoded over the categories of the training data, unknown or missing
+      categories being encoded as all zeros
+
+    Args:
+        numeric_columns (list of str) [OPTIONAL]: the numeric columns, by default the numeric columns of the data
+            passed to fit() that are not categorical
+        categorical_columns (list of str) [OPTIONAL]: the categorical columns, by default the non-numeric columns
+            of the data passed to fit()
+    """
+
+    def __init__(self, numeric_columns=None, categorical_columns=None):
+        self.numeric_columns = list(numeric_columns) if numeric_columns is not None else None
+        self.categorical_columns = list(categorical_columns) if categorical_columns is not None else None
+        self.fill_values = None
+        self.categories = None
+
+    def fit(self, df, feature_columns=None, rows=None):
+        """
+        Fits the constants of the transform: the fill values of the numeric columns and the categories of the
+        categorical columns.
+
+        Args:
+            df (Pandas DataFrame): the training data
+            feature_columns (list of str) [OPTIONAL]: the columns to use as features when the numeric and
+                categorical columns were not given, by default all the columns of df
+            rows (numpy array) [OPTIONAL]: the positions of the rows to fit on, e.g. the training rows of a split,
+                by default all the rows; only one column of these rows is copied at a time
+        Returns:
+            self: the fitted transform
+        """
+        columns = list(df.columns) if feature_columns is None else list(feature_columns)
+        if self.numeric_columns is None and self.categorical_columns is None:
+            numeric = set(df[columns].select_dtypes(include=["number", "bool"]).columns)
+            self.numeric_columns = [column for column in columns if column in numeric]
+            self.categorical_columns = [column for column in columns if column not in numeric]
+        elif self.numeric_columns is None:
+            self.numeric_columns = [column for column in columns if column not in self.categorical_columns]
+        elif self.categorical_columns is None:
+            self.categorical_columns = [column for column in columns if column not in self.numeric_columns]
+
+        self.fill_values = []
+        for column in self.numeric_columns:
+            values = df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+            if rows is not None:
+                values = values[rows]
+            median = np.nanmedian(values) if not np.isnan(values).all() else 0.0
+            self.fill_values.append(float(median))
+
+        self.categories = []
+        for column in self.categorical_columns:
+            values = df[column] if rows is None else df[column].iloc[rows]
+            self.categories.append(sorted({str(value) for value in values.dropna().unique()}))
+
+        self._compile()
+        return self
+
+    def _compile(self):
+        # the numpy arrays used by transform(), built once rather than on every call
+        self._fill_values = np.asarray(self.fill_values, dtype=np.float32)
+        self._codes = [{category: code for code, category in enumerate(categories)} for categories in self.categories]
+        self._offsets = np.cumsum([len(self.numeric_columns)] + [len(c) for c in self.categories]).tolist()
+
+    @property
+    def feature_names(self):
+        """The names of the output features, in order."""
+        return self.numeric_columns + [f"{column}={category}" for column, categories
+                                       in zip(self.categorical_columns, self.categories) for category in categories]
+
+    @property
+    def num_features(self):
+        return self._offsets[-1]
+
+    @staticmethod
+    def _rows(data, rows=None):
+        """
+        Gives access to the columns of a DataFrame, a dictionary of lists or scalars (e.g. a single request),
+        or a list of dictionaries.
+        """
+        if hasattr(data, "columns"):
+            if rows is not None:
+                return len(rows), lambda column, numeric: (
+                    data[column].to_numpy(dtype=np.float32, na_value=np.nan)[rows] if numeric
+                    else data[column].iloc[rows])
+            return len(data), lambda column, numeric: (
+                data[column].to_numpy(dtype=np.float32, na_value=np.nan) if numeric else data[column])
+        if rows is not None:
+            raise ValueError("Rows can only be selected from a DataFrame")
+        if isinstance(data, dict):
+            values = next(iter(data.values()), None)
+            if isinstance(values, (list, tuple, np.ndarray)):
+                return len(values), lambda column, numeric: data.get(column, [None] * len(values))
+            return 1, lambda column, numeric: [data.get(column)]
+        return len(data), lambda column, numeric: [row.get(column) for row in data]
+
+    def transform(self, data, rows=None, out=None):
+        """
+        Applies the transform to a batch of rows.
+
+        Args:
+            data: a DataFrame, a dictionary of column values (lists for a batch, scalars for a single row),
+                or a list of dictionaries, one per row
+            rows (numpy array) [OPTIONAL]: the positions of the rows of a DataFrame to transform, in the order
+                they should appear in the output, by default all the rows
+            out (numpy array) [OPTIONAL]: a float32 array of shape (rows, num_features) to write the features to,
+                e.g. a memory-mapped .npy file
+        Returns:
+            X: a float32 numpy array of shape (rows, num_features), out if it was given
+        """
+        if self.fill_values is None:
+            raise ValueError("The transform must be fitted or loaded before it is applied")
+        n_rows, get_column = self._rows(data, rows)
+        if out is None:
+            X = np.zeros((n_rows, self.num_features), dtype=np.float32)
+        elif out.shape != (n_rows, self.num_features) or out.dtype != np.float32:
+            raise ValueError(f"out must be a float32 array of shape {(n_rows, self.num_features)}")
+        else:
+            X = out
+            X[:] = 0
+
+        for i, column in enumerate(self.numeric_columns):
+            values = get_column(column, True)
+            if not isinstance(values, np.ndarray) or values.dtype != np.float32:
+                try:
+                    values = np.array([np.nan if _is_missing(value) else value for value in values], dtype=np.float32)
+                except (TypeError, ValueError) as e:
+                    raise ValueError(f"Column {column} has non-numeric values: {e}")
+            X[:, i] = np.where(np.isnan(values), self._fill_values[i], values)
+
+        rows = np.arange(n_rows)
+        for i, codes_of in enumerate(self._codes):
+            values = get_column(self.categorical_columns[i], False)
+            # categories are compared as strings; unknown and missing values get the code -1
+            if hasattr(values, "isna"):
+                # pandas is only imported for pandas inputs, so that serving only depends on numpy
+                import pandas as pd
+
+                codes = np.asarray(pd.Categorical(values, categories=self.categories[i]).codes)
+                unmatched = (codes < 0) & values.notna().to_numpy()
+                if unmatched.any():
+                    # e.g. numbers in a categorical column, whose categories were fitted as strings
+                    codes = codes.astype(np.int64)
+                    codes[unmatched] = pd.Categorical(values[unmatched].astype(str), categories=self.categories[i]).codes
+            else:
+                codes = np.array([-1 if _is_missing(value) else codes_of.get(str(value), -1) for value in values],
+                                 dtype=np.int64)
+            known = codes >= 0
+            X[rows[known], self._offsets[i] + codes[known]] = 1.0
+
+        return X
+
+    def to_dict(self):
+        return {"numeric_columns": self.numeric_columns, "fill_values": self.fill_values,
+                "categorical_columns": self.categorical_columns, "categories": self.categories}
+
+    @classmethod
+    def from_dict(cls, state):
+        transform = cls(state["numeric_columns"], state["categorical_columns"])
+        transform.fill_values = list(state["fill_values"])
+        transform.categories = [list(categories) for categories in state["categories"]]
+        transform._compile()
+        return transform
+
+    def save(self, path):
+        """
+        Saves the fitted transform as a JSON file.
+
+        Args:
+            path (str): path to the JSON file
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a transform saved by save().
+
+        Args:
+            path (str): path to the JSON file
+        Returns:
+            transform: the fitted transform
+        """
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
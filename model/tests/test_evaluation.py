@@ -0,0 +1,32 @@
+import os
+import sys
+import numpy as np
+from sklearn.metrics import roc_auc_score
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from evaluation import evaluate  # noqa: E402
+
+
+# =================================================
+"""
+Checks that the ROC AUC computed from the binned scores matches scikit-learn, for distinct and for tied scores.
+"""
+
+
+def test_roc_auc_matches_scikit_learn():
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, 2, 50000)
+    # the rounded half of the scores has many ties
+    y_score = 1 / (1 + np.exp(-(y + rng.normal(0, 1.5, len(y)))))
+    y_score[::2] = np.round(y_score[::2], 2)
+    X = y_score[:, None]
+
+    metrics = evaluate(lambda X_chunk: X_chunk[:, 0], X, y, "test", chunk_rows=7000)
+    assert abs(metrics["test_roc_auc_score"] - roc_auc_score(y, y_score)) < 1e-4
+
+
+def test_roc_auc_of_a_single_class():
+    X = np.linspace(0, 1, 100)[:, None]
+    metrics = evaluate(lambda X_chunk: X_chunk[:, 0], X, np.ones(100, dtype=np.int64), "test")
+    assert "test_roc_auc_score" not in metrics
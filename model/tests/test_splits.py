@@ -0,0 +1,46 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from splits import folds, time_split  # noqa: E402
+
+
+# =================================================
+"""
+Checks that the time split and the time folds never put rows of the same time on both sides of a boundary, and that
+the time folds test every row after the first training set.
+"""
+
+
+@pytest.fixture
+def times():
+    # few distinct times, so that a boundary on the row count would fall inside a run of equal times
+    return np.random.default_rng(0).integers(0, 50, 1000)
+
+
+def test_time_split_keeps_times_together(times):
+    train_rows, test_rows = time_split(times, 0.2)
+    assert len(train_rows) + len(test_rows) == len(times)
+    assert times[train_rows].max() < times[test_rows].min()
+    assert 0.15 < len(test_rows) / len(times) <= 0.2
+
+
+def test_time_split_of_a_single_time():
+    with pytest.raises(ValueError):
+        time_split(np.zeros(10), 0.2)
+
+
+@pytest.mark.parametrize("n_rows", [1000, 1003])
+def test_time_folds(times, n_rows):
+    times = np.resize(times, n_rows)
+    splits = list(folds(4, times=times))
+    assert len(splits) == 4
+    for train_rows, test_rows in splits:
+        assert times[train_rows].max() < times[test_rows].min()
+    # the testing folds follow each other up to the latest row, the leftover rows included
+    tested = np.concatenate([test_rows for _, test_rows in splits])
+    assert len(tested) + len(splits[0][0]) == n_rows
+    assert times[tested].max() == times.max()
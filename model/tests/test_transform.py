@@ -0,0 +1,101 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from transform import FEATURE_TRANSFORM_FILE, FeatureTransform  # noqa: E402
+
+
+# =================================================
+"""
+Checks that the feature transform gives the same features on the training path (a whole DataFrame) and on the
+serving path (one request at a time, after a save/load round trip), and that both match a pandas implementation.
+"""
+
+
+def make_data(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "heat_deviation": rng.normal(0, 2, n_rows),
+        "speed_deviation": rng.normal(1, 1.5, n_rows),
+        "assembly_line_num": rng.choice([f"assembly_{i}" for i in range(5)], n_rows),
+        "days_since_last_service": rng.poisson(100, n_rows),
+        "operator": rng.choice([f"operator{i}" for i in range(8)], n_rows),
+    })
+    df.loc[rng.random(n_rows) < 0.05, "heat_deviation"] = np.nan
+    df.loc[rng.random(n_rows) < 0.05, "operator"] = None
+    return df
+
+
+def reference_transform(transform, df):
+    # the same transformation written with pandas
+    numeric = df[transform.numeric_columns].astype(np.float64)
+    numeric = numeric.fillna(dict(zip(transform.numeric_columns, transform.fill_values)))
+    encoded = [pd.get_dummies(pd.Categorical(df[column].astype(object).where(df[column].notna(), None),
+                                             categories=categories))
+               for column, categories in zip(transform.categorical_columns, transform.categories)]
+    return np.hstack([numeric.to_numpy()] + [e.to_numpy() for e in encoded]).astype(np.float32)
+
+
+@pytest.fixture
+def transform():
+    return FeatureTransform().fit(make_data(2000))
+
+
+@pytest.fixture
+def loaded(transform, tmp_path):
+    path = tmp_path / FEATURE_TRANSFORM_FILE
+    transform.save(path)
+    return FeatureTransform.load(path)
+
+
+@pytest.fixture
+def test_df():
+    df = make_data(500, seed=1)
+    # a request with an unknown category and a missing feature
+    unseen = dict(df.iloc[0].to_dict(), assembly_line_num="assembly_99")
+    del unseen["speed_deviation"]
+    return pd.concat([df, pd.DataFrame([unseen])], ignore_index=True)
+
+
+def test_batch_matches_pandas_reference(transform, test_df):
+    X = transform.transform(test_df)
+    assert X.dtype == np.float32
+    assert X.shape == (len(test_df), transform.num_features)
+    np.testing.assert_array_equal(X, reference_transform(transform, test_df))
+
+
+def test_reloaded_transform_matches(transform, loaded, test_df):
+    assert loaded.to_dict() == transform.to_dict()
+    np.testing.assert_array_equal(loaded.transform(test_df), transform.transform(test_df))
+
+
+@pytest.mark.parametrize("to_requests", [
+    lambda df: df.to_dict("records"),
+    lambda df: [df.to_dict("records")],
+    lambda df: [df.to_dict("list")],
+], ids=["single rows", "list of rows", "column lists"])
+def test_serving_inputs_match_batch(transform, loaded, test_df, to_requests):
+    requests = to_requests(test_df)
+    X = np.vstack([loaded.transform(request) for request in requests])
+    np.testing.assert_array_equal(X, transform.transform(test_df))
+
+
+def test_unknown_and_missing_values(transform):
+    X = transform.transform({"heat_deviation": None, "assembly_line_num": "assembly_99", "operator": None})
+    # missing numeric values are filled with the training medians, unknown or missing categories are all zeros
+    np.testing.assert_array_equal(X[0, :len(transform.numeric_columns)],
+                                  np.asarray(transform.fill_values, dtype=np.float32))
+    assert not X[0, len(transform.numeric_columns):].any()
+
+
+def test_rows_and_out(transform, test_df, tmp_path):
+    rows = np.array([5, 2, 7])
+    out = np.lib.format.open_memmap(tmp_path / "X.npy", mode="w+", dtype=np.float32,
+                                    shape=(len(rows), transform.num_features))
+    X = transform.transform(test_df, rows=rows, out=out)
+    assert X is out
+    np.testing.assert_array_equal(X, transform.transform(test_df.iloc[rows]))
@@ -0,0 +1,215 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import mlflow
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+MONITORING_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, os.path.join(MONITORING_DIR, 'data_drift', 'data_drift_src'))
+sys.path.insert(0, os.path.join(MONITORING_DIR, 'model_performance', 'model_performance_src'))
+
+import data_drift  # noqa: E402
+import model_performance  # noqa: E402
+from synthetic_data import write_datasets  # noqa: E402
+
+# stage slowdowns smaller than this many seconds are treated as noise when comparing to a baseline
+NOISE_FLOOR_SECONDS = 0.05
+
+
+@contextmanager
+def timed_stage(stages, name, trace_memory=False):
+    '''
+    Time a stage, or record its peak Python heap usage (numpy and pandas buffers included).
+    Tracing the allocations slows the stage down, so the timings and the memory are measured in separate runs.
+    The memory used by worker processes, e.g. the plot rendering pool, is not included.
+    input: stages: the dictionary the stage results are added to, name: the name of the stage,
+    trace_memory: whether to trace the memory allocations instead of timing the stage
+    '''
+    if trace_memory:
+        tracemalloc.start()
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        if trace_memory:
+            stages[name] = {'peak_memory_mb': tracemalloc.get_traced_memory()[1] / 2 ** 20}
+            tracemalloc.stop()
+        else:
+            stages[name] = {'seconds': time.perf_counter() - start_wall,
+                            'cpu_seconds': time.process_time() - start_cpu}
+
+
+def benchmark_data_drift(paths, args, logger, trace_memory=False):
+    '''
+    Run the data drift monitor on the given files, one stage at a time, with the functions measure_drift runs.
+    output: stages, details: the results of the read, test, plot and log stages, and the number of drifted features
+    '''
+    stages = {}
+    with mlflow.start_run():
+        run_id = mlflow.active_run().info.run_id
+
+        with timed_stage(stages, 'read', trace_memory):
+            reference_df, new_df, sample_sizes = data_drift.read_drift_data(args)
+
+        with timed_stage(stages, 'test', trace_memory):
+            results = data_drift.test_drift(reference_df, new_df, args, run_id, sample_sizes=sample_sizes)
+
+        with tempfile.TemporaryDirectory() as plot_dir:
+            with timed_stage(stages, 'plot', trace_memory):
+                plotted = data_drift.plot_drift(reference_df, new_df, results, args, plot_dir)
+
+            with timed_stage(stages, 'log', trace_memory):
+                data_drift.log_drift(results, args, logger, plot_dir if plotted else None)
+
+    return stages, {'detected_drift_features': int(sum(results['drift_pred']['is_drift']))}
+
+
+def benchmark_model_performance(paths, args, logger, trace_memory=False):
+    '''
+    Run the model performance monitor on the given files, one stage at a time.
+    output: stages, details: the results of the read, test and log stages, and the computed metrics
+    '''
+    stages = {}
+    with mlflow.start_run():
+        with timed_stage(stages, 'read', trace_memory):
+            df = model_performance.read_data(paths['new_data_inference'], paths['new_data_groundtruth'], 'id')
+
+        with timed_stage(stages, 'test', trace_memory):
+            metrics = model_performance.get_metrics(df)
+
+        with timed_stage(stages, 'log', trace_memory):
+            mlflow.log_metrics(metrics)
+            logger.info(f'{args.model_name}_model_performance', extra={'custom_dimensions': metrics})
+            for handler in logger.handlers:
+                handler.flush()
+    return stages, {'metrics': metrics}
+
+
+def find_regressions(report, baseline, tolerance):
+    '''
+    Compare the stage timings of a report to a baseline report.
+    input: report, baseline: two benchmark reports, tolerance: the allowed relative slowdown, e.g. 0.25
+    output: regressions: a list of messages, one per stage slower than the baseline
+    '''
+    def key(result):
+        return (result['monitor'], result['rows'], result['columns'], result['plot_mode'])
+
+    baseline_results = {key(result): result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        previous = baseline_results.get(key(result))
+        if previous is None:
+            continue
+        for stage, timing in result['stages'].items():
+            if stage not in previous['stages']:
+                continue
+            before, after = previous['stages'][stage]['seconds'], timing['seconds']
+            if after > before * (1 + tolerance) and after - before > NOISE_FLOOR_SECONDS:
+                regressions.append(f"{key(result)} {stage}: {before:.3f}s -> {after:.3f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the monitoring jobs on synthetic data.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--columns', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--reference_rows', type=int, default=None,
+                        help='rows of the reference data, defaults to the number of new rows')
+    parser.add_argument('--cat_fraction', type=float, default=0.3)
+    parser.add_argument('--drift_fraction', type=float, default=0.2)
+    parser.add_argument('--drift_shift', type=float, default=0.5)
+    parser.add_argument('--monitors', type=str, nargs='+', default=['data_drift', 'model_performance'],
+                        choices=['data_drift', 'model_performance'])
+    parser.add_argument('--plot_mode', type=str, default='binned', choices=['full', 'binned', 'summary'])
+    parser.add_argument('--plot_top_k', type=int, default=None)
+    parser.add_argument('--plot_bins', type=int, default=30)
+    parser.add_argument('--plot_workers', type=int, default=None)
+    parser.add_argument('--export_latency', type=float, default=0.0,
+                        help='simulated App Insights round-trip time, in seconds')
+    parser.add_argument('--no_memory', action='store_true',
+                        help='do not run the monitors a second time to trace the memory allocations')
+    parser.add_argument('--data_dir', type=str, default=None, help='where to keep the generated data')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='benchmark_report.json')
+    parser.add_argument('--baseline', type=str, default=None, help='a previous report to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    work_dir = tempfile.TemporaryDirectory()
+    data_dir = args.data_dir or work_dir.name
+    mlflow.set_tracking_uri(f"file:{os.path.join(work_dir.name, 'mlruns')}")
+
+    log_handler = data_drift.LocalLogHandler(export_latency=args.export_latency)
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.INFO)
+    logger.addHandler(log_handler)
+
+    report = {'created': datetime.utcnow().isoformat(), 'python': platform.python_version(),
+              'machine': platform.machine(), 'cpu_count': os.cpu_count(), 'settings': vars(args), 'results': []}
+
+    for n_rows in args.rows:
+        for n_columns in args.columns:
+            dataset_dir = os.path.join(data_dir, f'{n_rows}x{n_columns}')
+            paths, drifted_columns = write_datasets(
+                dataset_dir, n_rows, n_columns, reference_rows=args.reference_rows, cat_fraction=args.cat_fraction,
+                drift_fraction=args.drift_fraction, drift_shift=args.drift_shift, seed=args.seed)
+
+            for monitor in args.monitors:
+                monitor_argv = ['--model_name', 'benchmark', '--model_version', '1', '--mlflow_uri', 'unused',
+                                '--logger_connection_string', 'local']
+                if monitor == 'data_drift':
+                    monitor_args = data_drift.parse_args(monitor_argv + [
+                        '--reference_data_path', paths['reference_data'], '--new_data_path', paths['new_data'],
+                        '--plot_mode', args.plot_mode, '--plot_bins', str(args.plot_bins)]
+                        + (['--plot_top_k', str(args.plot_top_k)] if args.plot_top_k is not None else [])
+                        + (['--plot_workers', str(args.plot_workers)] if args.plot_workers is not None else []))
+                    benchmark = benchmark_data_drift
+                else:
+                    monitor_args = model_performance.parse_args(monitor_argv + [
+                        '--inference_data_path', paths['new_data_inference'],
+                        '--groundtruth_data_path', paths['new_data_groundtruth'], '--index_name', 'id'])
+                    benchmark = benchmark_model_performance
+
+                export_calls = log_handler.export_calls
+                stages, details = benchmark(paths, monitor_args, logger)
+                telemetry_exports = log_handler.export_calls - export_calls
+                if not args.no_memory:
+                    memory_stages, _ = benchmark(paths, monitor_args, logger, trace_memory=True)
+                    for name, stage in memory_stages.items():
+                        stages[name].update(stage)
+
+                result = {'monitor': monitor, 'rows': n_rows, 'columns': n_columns, 'plot_mode': args.plot_mode,
+                          'injected_drift_features': len(drifted_columns),
+                          'telemetry_exports': telemetry_exports,
+                          'stages': stages, 'total_seconds': sum(stage['seconds'] for stage in stages.values())}
+                result.update(details)
+                report['results'].append(result)
+                print(f"{monitor} {n_rows}x{n_columns}: " + ", ".join(
+                    f"{name} {stage['seconds']:.2f}s" for name, stage in stages.items()))
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f'Report written to {args.output}')
+
+    work_dir.cleanup()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+def make_schema(n_columns, cat_fraction=0.3, n_categories=5, seed=0):
+    '''
+    Describe a set of mixed-type columns shaped like the sample data.
+    input:
+    n_columns: the number of feature columns
+    cat_fraction: the fraction of categorical columns
+    n_categories: the number of categories of each categorical column
+    seed: the random seed
+    output: schema: a list of column descriptions (name, type and distribution parameters)
+    '''
+    rng = np.random.default_rng(seed)
+    n_cat = int(round(n_columns * cat_fraction))
+    schema = []
+    for i in range(n_columns):
+        if i < n_cat:
+            schema.append({'name': f'cat_{i}', 'type': 'categorical',
+                           'categories': [f'category_{j}' for j in range(n_categories)],
+                           'probabilities': rng.dirichlet(np.ones(n_categories) * 5)})
+        elif i % 3 == 0:
+            # integer counts, like days_since_last_service
+            schema.append({'name': f'int_{i}', 'type': 'integer', 'mean': float(rng.integers(10, 200))})
+        else:
+            schema.append({'name': f'cont_{i}', 'type': 'continuous',
+                           'mean': rng.normal(0, 2), 'std': rng.uniform(0.5, 3)})
+    return schema
+
+
+def drift_schema(schema, drift_fraction, drift_shift, seed=0):
+    '''
+    Inject a drift in a fraction of the columns of a schema.
+    input:
+    schema: the output of make_schema
+    drift_fraction: the fraction of the columns to drift
+    drift_shift: the size of the drift; the mean shift in standard deviations for numeric columns,
+    and the weight moved to the least frequent category for categorical columns
+    seed: the random seed
+    output: schema, drifted_columns: the drifted schema and the names of the drifted columns
+    '''
+    rng = np.random.default_rng(seed)
+    n_drift = int(round(len(schema) * drift_fraction))
+    drifted = set(rng.choice(len(schema), size=n_drift, replace=False).tolist())
+    new_schema = []
+    for i, column in enumerate(schema):
+        column = dict(column)
+        if i in drifted:
+            if column['type'] == 'categorical':
+                probabilities = np.asarray(column['probabilities']) * (1 - drift_shift)
+                probabilities[np.argmin(probabilities)] += drift_shift
+                column['probabilities'] = probabilities
+            elif column['type'] == 'integer':
+                column['mean'] = column['mean'] * (1 + drift_shift / np.sqrt(column['mean']))
+            else:
+                column['mean'] = column['mean'] + drift_shift * column['std']
+        new_schema.append(column)
+    return new_schema, [schema[i]['name'] for i in sorted(drifted)]
+
+
+def generate_frame(schema, n_rows, rng):
+    '''
+    Draw n_rows rows following the schema.
+    input: schema: the output of make_schema, n_rows: the number of rows, rng: a numpy random generator
+    output: df: the generated dataframe
+    '''
+    data = {}
+    for column in schema:
+        if column['type'] == 'categorical':
+            data[column['name']] = rng.choice(column['categories'], size=n_rows, p=column['probabilities'])
+        elif column['type'] == 'integer':
+            data[column['name']] = rng.poisson(column['mean'], size=n_rows)
+        else:
+            data[column['name']] = rng.normal(column['mean'], column['std'], size=n_rows)
+    return pd.DataFrame(data)
+
+
+def write_datasets(output_dir, n_rows, n_columns, reference_rows=None, cat_fraction=0.3,
+                   drift_fraction=0.2, drift_shift=0.5, seed=0, chunk_rows=200000):
+    '''
+    Write synthetic reference, new, inference and ground truth datasets shaped like monitoring/sample_data.
+    The files are written in chunks, so that datasets larger than memory can be generated.
+    input:
+    output_dir: the folder the csv files are written to
+    n_rows: the number of rows of the new, inference and ground truth data
+    n_columns: the number of feature columns
+    reference_rows: the number of rows of the reference data, defaults to n_rows
+    cat_fraction: the fraction of categorical columns
+    drift_fraction, drift_shift: the drift injected in the new data (see drift_schema)
+    seed: the random seed
+    chunk_rows: the number of rows generated at once
+    output: paths, drifted_columns: the paths of the four files and the names of the drifted columns
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    schema = make_schema(n_columns, cat_fraction=cat_fraction, seed=seed)
+    new_schema, drifted_columns = drift_schema(schema, drift_fraction, drift_shift, seed=seed)
+    paths = {name: os.path.join(output_dir, f'{name}.csv')
+             for name in ['reference_data', 'new_data', 'new_data_inference', 'new_data_groundtruth']}
+
+    reference_rows = n_rows if reference_rows is None else reference_rows
+    for start in range(0, reference_rows, chunk_rows):
+        chunk = generate_frame(schema, min(chunk_rows, reference_rows - start), rng)
+        chunk.to_csv(paths['reference_data'], mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+    for start in range(0, n_rows, chunk_rows):
+        size = min(chunk_rows, n_rows - start)
+        ids = np.arange(start, start + size)
+        new_df = generate_frame(new_schema, size, rng)
+        new_df.insert(0, 'id', ids)
+
+        ground_truth = rng.random(size) < 0.3
+        # a reasonably good model: the score is correlated with the label
+        pred_proba = np.clip(0.35 * ground_truth + rng.beta(2, 5, size), 0, 1).round(2)
+        inference_df = pd.DataFrame({'id': ids, 'pred': (pred_proba >= 0.5).astype(int), 'pred_proba': pred_proba})
+        groundtruth_df = pd.DataFrame({'id': ids, 'ground_truth': ground_truth.astype(int)})
+
+        mode, header = ('w', True) if start == 0 else ('a', False)
+        new_df.to_csv(paths['new_data'], mode=mode, header=header, index=False)
+        inference_df.to_csv(paths['new_data_inference'], mode=mode, header=header, index=False)
+        groundtruth_df.to_csv(paths['new_data_groundtruth'], mode=mode, header=header, index=False)
+
+    return paths, drifted_columns
@@ -1,85 +1,289 @@
 import argparse
+import glob
 import mlflow
 import os
+import json
+import time
+import tempfile
 import pandas as pd
 from sklearn.compose import make_column_selector as selector
 import numpy as np
-from matplotlib import pyplot as plt
+from scipy import stats, optimize
 from alibi_detect.cd import TabularDrift
 import logging
 from opencensus.ext.azure.log_exporter import AzureLogHandler
-import seaborn as sns
 
 
-def kde_plot(x_ref, x_new, title):
+# significance level of the drift tests, before the Bonferroni correction applied by TabularDrift
+P_VALUE = .05
+
+# connection strings starting with this prefix send telemetry to the LocalLogHandler instead of App Insights
+LOCAL_EXPORTER = 'local'
+
+
+class LocalLogHandler(logging.Handler):
     '''
-    Plot the distribution of the reference and new data using a kernel density estimate.
-    input: 
-    x_ref, x_new: the reference and new data
-    title: the title of the plot
-    output: fig: the figure object
+    Offline stand-in for the AzureLogHandler, used to measure the cost of telemetry emission without App Insights.
+    Records are buffered and exported in batches of max_batch_size, the same way the AzureLogHandler
+    bundles records into a single App Insights request.
+    input:
+    output_path: optional path of a JSON lines file each exported record is appended to
+    max_batch_size: the maximum number of records sent in a single export
+    export_latency: the simulated round-trip time of a single export, in seconds
     '''
-    plt.figure()
-    dist_plot = sns.kdeplot(x_ref, shade=True, color='blue', label='reference')
-    sns.kdeplot(x_new, shade=True, color='red', label='new')
-    dist_plot.set_title(title)
-    fig = dist_plot.get_figure()
-    return fig
-
 
-def cat_bar_plot(reference_df, new_df, col, drift_detected):
+    def __init__(self, output_path=None, max_batch_size=100, export_latency=0.0):
+        super().__init__()
+        self.output_path = output_path
+        self.max_batch_size = max_batch_size
+        self.export_latency = export_latency
+        self.export_calls = 0
+        self.exported_records = 0
+        self._buffer = []
+
+    def emit(self, record):
+        self._buffer.append({'message': record.getMessage(),
+                             'custom_dimensions': getattr(record, 'custom_dimensions', {})})
+        if len(self._buffer) >= self.max_batch_size:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            while self._buffer:
+                batch = self._buffer[:self.max_batch_size]
+                self._buffer = self._buffer[self.max_batch_size:]
+                self._export(batch)
+        finally:
+            self.release()
+
+    def _export(self, batch):
+        time.sleep(self.export_latency)
+        if self.output_path:
+            with open(self.output_path, 'a') as f:
+                f.writelines(json.dumps(item, default=str) + '\n' for item in batch)
+        self.export_calls += 1
+        self.exported_records += len(batch)
+
+
+def get_log_handler(connection_string, max_batch_size=100):
     '''
-    Plot the distribution of the reference and new data using a bar plot.
-    input: reference_df, new_df: the reference and new data
-    drift_detected: boolean indicating whether a drift was detected
-    output: fig: the figure object
+    Create the handler used to send the drift telemetry.
+    input:
+    connection_string: the App Insights connection string, or 'local[:<path>]' to use the LocalLogHandler
+    max_batch_size: the maximum number of records sent to App Insights in a single request
+    output: handler: the logging handler
     '''
-    ref_counts = reference_df[col].value_counts(normalize=True).reset_index()
-    ref_counts['source'] = 'reference data'
+    if connection_string.startswith(LOCAL_EXPORTER):
+        output_path = connection_string[len(LOCAL_EXPORTER):].lstrip(':') or None
+        return LocalLogHandler(output_path=output_path, max_batch_size=max_batch_size)
+    return AzureLogHandler(connection_string=connection_string, max_batch_size=max_batch_size)
 
-    new_counts = new_df[col].value_counts(normalize=True).reset_index()
-    new_counts['source'] = 'new data'
 
-    counts_df = pd.concat([ref_counts, new_counts])
-    plt.figure()
-    fig = sns.barplot(x=col, y='index', hue='source', data=counts_df)
-    fig.set_title(f'{col}: drift detected: {bool(drift_detected)}')
-    fig = fig.get_figure()
+# is_parquet, list_parquet_files and read_table are duplicated in model_performance_src/model_performance.py, as each
+# monitoring job only ships its own source folder: keep both copies identical.
+def is_parquet(path):
+    '''
+    Whether a path is a parquet file or a folder of parquet files, e.g. the inference capture of the model API.
+    '''
+    return os.path.isdir(path) or path.endswith('.parquet')
+
 
-    return fig
+def list_parquet_files(path):
+    '''
+    List the parquet files of a folder and its subfolders (e.g. date=YYYY-MM-DD/hour=HH/part-*.parquet), in order.
+    Hidden files, such as the files the inference capture is still writing, are skipped.
+    '''
+    if not os.path.isdir(path):
+        return [path]
+    files = sorted(glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True))
+    if not files:
+        raise FileNotFoundError(f'No parquet files found in {path}')
+    return files
 
 
-def pval_heatmap(col_name, p_vals):
+def read_table(path):
     '''
-    Plot the p values of the statistical tests used to detect the drift.
-    inputs:
-    col_name: the name of the columns
-    p_vals: the p values
-    output: fig: the figure object
+    Read a csv file, a parquet file or a folder of parquet files.
+    The files of a folder are read one by one, so that a column whose type changed between files can still be read.
     '''
-    p_values = {col_name[i]: p_vals[i] for i in range(len(col_name))}
+    if not is_parquet(path):
+        return pd.read_csv(path)
+    return pd.concat([pd.read_parquet(file) for file in list_parquet_files(path)], ignore_index=True)
 
-    p_values = pd.DataFrame([p_values]).T
 
-    plt.figure()
-    heatplot = sns.heatmap(p_values, annot=True, cmap=[
-                           'red', 'blue'], center=0.05)
-    heatplot.figure.suptitle('P vals summary')
-    fig = heatplot.get_figure()
-    return fig
+def read_chunks(path, chunksize):
+    '''
+    Read a csv file, a parquet file or a folder of parquet files in chunks of at most chunksize rows.
+    The chunks are indexed by their row number in the whole data, as pd.read_csv does.
+    '''
+    if not is_parquet(path):
+        yield from pd.read_csv(path, chunksize=chunksize)
+        return
+    import pyarrow.parquet as pq
+
+    start = 0
+    for file in list_parquet_files(path):
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=chunksize):
+            chunk = batch.to_pandas()
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
 
 
 def read_data(reference_data_path, new_data_path):
     '''
-    In the template, the assumption is that the data are stored in csv files,
+    In the template, the assumption is that the data are stored in csv files, or in parquet files
+    such as the inference capture of the model API.
     Change this function to read the data using the appropriate method for your data type.
 
     '''
-    reference_df = pd.read_csv(reference_data_path)
-    new_df = pd.read_csv(new_data_path)
+    reference_df = read_table(reference_data_path)
+    new_df = read_table(new_data_path)
     return reference_df, new_df
 
 
+def required_sample_size(power, min_effect, alpha, n_categories=None):
+    '''
+    Estimate how many rows of each dataset are needed for a drift test to reach the target power.
+    inputs: power: the target probability of detecting a drift of size min_effect,
+    min_effect: the smallest drift worth detecting; the Kolmogorov-Smirnov distance for continuous
+    features and Cohen's w for categorical features, alpha: the significance level of the test,
+    n_categories: the number of categories of a categorical feature, None for a continuous feature
+    outputs: n: the number of rows to sample from both the reference and the new data
+    '''
+    if n_categories is None:
+        # sqrt(n_eff) * (D_hat - D) has a standard deviation of at most 0.5, n_eff = n * m / (n + m)
+        c_alpha = np.sqrt(-np.log(alpha / 2) / 2)
+        n_eff = ((c_alpha + 0.5 * stats.norm.ppf(power)) / min_effect) ** 2
+    else:
+        # the chi-squared statistic follows a non-central distribution with noncentrality n_eff * w ** 2
+        dof = max(n_categories - 1, 1)
+        critical_value = stats.chi2.ppf(1 - alpha, dof)
+        noncentrality = optimize.brentq(
+            lambda nc: stats.ncx2.sf(critical_value, dof, nc) - power, 1e-6, 1e6)
+        n_eff = noncentrality / min_effect ** 2
+    return int(np.ceil(2 * n_eff))
+
+
+def required_sample_sizes(reference_df, cat_col, power, min_distance, min_effect_size):
+    '''
+    This function is used to compute the sample size each feature needs to reach the target power.
+    inputs: reference_df: the reference data, cat_col: the categorical columns, power: the target power,
+    min_distance: the smallest Kolmogorov-Smirnov distance to detect on the continuous columns,
+    min_effect_size: the smallest Cohen's w to detect on the categorical columns
+    outputs: sample_sizes: a dictionary mapping each column to its sample size
+    '''
+    # the same Bonferroni correction as TabularDrift
+    alpha = P_VALUE / len(reference_df.columns)
+    sample_sizes = {}
+    for col in reference_df.columns:
+        if col in cat_col:
+            sample_sizes[col] = required_sample_size(power, min_effect_size, alpha,
+                                                     n_categories=reference_df[col].nunique())
+        else:
+            sample_sizes[col] = required_sample_size(power, min_distance, alpha)
+    return sample_sizes
+
+
+def reservoir_sample_csv(path, n, seed, chunksize=100000):
+    '''
+    Draw a uniform sample of n rows from a csv or parquet file (see read_chunks) without loading it all in memory.
+    Every row gets a random key and the n rows with the smallest keys are kept, so the sample
+    only depends on the seed, not on the chunk size.
+    inputs: path: the path of the data, n: the sample size, seed: the random seed,
+    chunksize: the number of rows read at once
+    outputs: sample_df: the sampled rows, in file order
+    raises: ValueError if the data holds no rows (an empty or header-only file)
+    '''
+    rng = np.random.default_rng(seed)
+    sample_df, sample_keys = None, np.empty(0)
+    try:
+        for chunk in read_chunks(path, chunksize):
+            keys = np.concatenate([sample_keys, rng.random(len(chunk))])
+            sample_df = chunk if sample_df is None else pd.concat([sample_df, chunk])
+            if len(keys) > n:
+                keep = np.sort(np.argpartition(keys, n - 1)[:n])
+                sample_df, keys = sample_df.iloc[keep], keys[keep]
+            sample_keys = keys
+    except pd.errors.EmptyDataError:
+        # a csv file without even a header
+        sample_df = None
+    if sample_df is None or sample_df.empty:
+        raise ValueError(f'No rows to sample in {path}')
+    return sample_df.sort_index()
+
+
+def read_sampled_data(reference_data_path, new_data_path, power, min_distance, min_effect_size, seed):
+    '''
+    Read a sample of the reference and new data large enough for every feature to reach the target power.
+    inputs: reference_data_path, new_data_path: the paths of the data, power, min_distance,
+    min_effect_size: see required_sample_sizes, seed: the random seed of the sampling
+    outputs: reference_df, new_df: the sampled data, sample_sizes: the sample size required by each feature
+    '''
+    reference_df = read_table(reference_data_path)
+    cat_col = get_category_columns(reference_df)
+    sample_sizes = required_sample_sizes(reference_df, cat_col, power, min_distance, min_effect_size)
+    n = max(sample_sizes.values())
+    if len(reference_df) > n:
+        reference_df = reference_df.sample(n=n, random_state=seed).sort_index()
+    new_df = reservoir_sample_csv(new_data_path, n, seed)
+    return reference_df, new_df, sample_sizes
+
+
+def read_sketch_snapshots(sketch_path):
+    '''
+    Read the feature sketches exported by the /sketches endpoint of the model API.
+    input: sketch_path: a json file holding a snapshot, or a list of snapshots of several workers
+    output: snapshots: the list of snapshots
+    '''
+    with open(sketch_path) as f:
+        snapshots = json.load(f)
+    return snapshots if isinstance(snapshots, list) else [snapshots]
+
+
+def sketch_to_frame(snapshots, reference_df, cat_col, max_rows=100000, seed=42):
+    '''
+    Rebuild a stand-in for the new data from the feature sketches of the serving workers, so that the drift
+    tests can run without the row-level data. The snapshots of all the workers are pooled.
+    Continuous columns take the values of the pooled quantile sketches at evenly spaced quantiles, and categorical
+    columns repeat the most frequent categories of the pooled count-min sketches in proportion to their counts.
+    inputs: snapshots: the output of read_sketch_snapshots, reference_df: the reference data,
+    cat_col: the categorical columns, max_rows: the maximum number of rows to rebuild, seed: the random seed
+    outputs: new_df: the rebuilt new data, with one row per sketched row up to max_rows
+    '''
+    rng = np.random.default_rng(seed)
+    # snapshots written before the rows were counted only hold the number of requests
+    n_rows = min(max_rows, sum(snapshot.get('rows', snapshot['requests']) for snapshot in snapshots))
+    probabilities = (np.arange(n_rows) + 0.5) / n_rows
+    new_data = {}
+    for col in reference_df.columns:
+        sketches = [snapshot['features'][col] for snapshot in snapshots if col in snapshot['features']]
+        values = np.full(n_rows, np.nan, dtype=object if col in cat_col else float)
+
+        if col in cat_col:
+            counts = pd.Series(dtype=float)
+            for sketch in sketches:
+                heavy_hitters = pd.Series(sketch.get('categories', {}).get('heavy_hitters', {}), dtype=float)
+                counts = counts.add(heavy_hitters, fill_value=0)
+            if counts.sum() > 0:
+                # largest remainder rounding, so that the repeats add up to n_rows
+                expected = counts.to_numpy() / counts.sum() * n_rows
+                repeats = np.floor(expected).astype(int)
+                repeats[np.argsort(repeats - expected)[:n_rows - repeats.sum()]] += 1
+                values = np.repeat(counts.index.to_numpy(dtype=object), repeats)
+        else:
+            items = [(value, 2 ** level) for sketch in sketches if 'quantiles' in sketch
+                     for level, level_items in enumerate(sketch['quantiles']['levels']) for value in level_items]
+            if items:
+                items = np.array(sorted(items), dtype=float)
+                cdf = np.cumsum(items[:, 1]) / items[:, 1].sum()
+                values = items[np.minimum(np.searchsorted(cdf, probabilities), len(items) - 1), 0]
+
+        new_data[col] = rng.permutation(values)
+    return pd.DataFrame(new_data)
+
+
 def get_category_columns(df):
     '''
     This function is used to get the categorical columns in the data.
@@ -98,7 +302,7 @@ def compare_distributions(reference_df, new_df, cat_col):
     '''
     categorical_columns_dict = {
         list(reference_df.columns).index(i): None for i in cat_col}
-    cd = TabularDrift(reference_df.values, p_val=.05,
+    cd = TabularDrift(reference_df.values, p_val=P_VALUE,
                       categories_per_feature=categorical_columns_dict)
     fpreds = cd.predict(
         new_df[reference_df.columns].values, drift_type='feature')
@@ -117,19 +321,74 @@ def compute_severity_level(drift_pred):
     return 0
 
 
-def gen_categorical_metrics(reference_df, new_df, col):
+def compute_histograms(reference_df, new_df, cat_col, bins=30):
+    '''
+    This function is used to bin the reference and new data once, so that the plots and metrics
+    do not need to go back to the raw columns.
+    inputs: reference_df, new_df: the reference and new data, cat_col: the categorical columns,
+    bins: the number of bins of the continuous histograms
+    outputs: histograms: a dictionary mapping each column to its binned distributions;
+    {'edges', 'ref', 'new'} densities for continuous columns and {'ref', 'new'} frequencies
+    (sorted by decreasing frequency) for categorical columns
+    '''
+    histograms = {}
+    for col in reference_df.columns:
+        if col in cat_col:
+            histograms[col] = {'ref': reference_df[col].value_counts(normalize=True),
+                               'new': new_df[col].value_counts(normalize=True)}
+            continue
+
+        x_ref = reference_df[col].to_numpy(dtype=float)
+        x_new = new_df[col].to_numpy(dtype=float)
+        x_ref, x_new = x_ref[~np.isnan(x_ref)], x_new[~np.isnan(x_new)]
+        low = min(x_ref.min(initial=np.inf), x_new.min(initial=np.inf))
+        high = max(x_ref.max(initial=-np.inf), x_new.max(initial=-np.inf))
+        if not np.isfinite(low):
+            low, high = 0.0, 1.0
+        elif low == high:
+            low, high = low - 0.5, high + 0.5
+        edges = np.linspace(low, high, bins + 1)
+        histograms[col] = {'edges': edges,
+                           'ref': np.histogram(x_ref, edges, density=len(x_ref) > 0)[0],
+                           'new': np.histogram(x_new, edges, density=len(x_new) > 0)[0]}
+    return histograms
+
+
+def select_plot_features(columns, drift_pred, top_k=None):
+    '''
+    This function is used to choose the features that are worth plotting.
+    inputs: columns: the column names, drift_pred: the results of the statistical tests,
+    top_k: if given, the number of features with the smallest p-value to plot
+    outputs: features: the names of the features to plot; the drifted features if top_k is not given
+    '''
+    if top_k is not None:
+        # the distances are not comparable across tests (a chi-squared statistic for categorical features, a
+        # Kolmogorov-Smirnov distance for continuous ones), so the features are ranked on their p-values,
+        # the distance only breaking ties such as p-values of 0
+        order = np.lexsort((-np.asarray(drift_pred['distance'], dtype=float),
+                            np.asarray(drift_pred['p_val'], dtype=float)))
+        return [columns[i] for i in order[:top_k]]
+    return [col for col, drift in zip(columns, drift_pred['is_drift']) if drift]
+
+
+def gen_categorical_metrics(reference_df, new_df, col, histogram=None):
     '''
     This function is used to generate the metrics for categorical columns.
-    inputs: reference_df, new_df: the reference and new data, col: the categorical column
+    inputs: reference_df, new_df: the reference and new data, col: the categorical column,
+    histogram: optional pre-computed frequencies of the column (see compute_histograms)
     outputs: metrics_dict: a dictionary containing the metrics
     '''
+    if histogram is not None:
+        most_frequent_category_new, most_frequent_category_ref = histogram['new'], histogram['ref']
+    else:
+        most_frequent_category_new = new_df[col].value_counts(normalize=True)
+        most_frequent_category_ref = reference_df[col].value_counts(normalize=True)
+
     metrics_dict = {}
-    most_frequent_category_new = new_df[col].value_counts(normalize=True)
     metrics_dict['most_common_category_new'] = most_frequent_category_new.index[0]
     metrics_dict['most_common_category_freq_new'] = str(
         most_frequent_category_new[0])
 
-    most_frequent_category_ref = reference_df[col].value_counts(normalize=True)
     metrics_dict['most_common_category_ref'] = most_frequent_category_ref.index[0]
     metrics_dict['most_common_category_freq_ref'] = str(
         most_frequent_category_ref[0])
@@ -148,73 +407,234 @@ def gen_cont_metrics(reference_df, new_df, col):
     return metrics_dict
 
 
-def main(args):
+def build_plot_tasks(plot_mode, reference_df, new_df, cat_col, drift_pred, histograms=None, top_k=None):
+    '''
+    This function is used to list the figures to render for the given plot mode.
+    inputs: plot_mode: 'full' plots every feature from the raw data, 'binned' plots the drifted
+    (or top_k) features from the pre-binned histograms and 'summary' does not plot anything,
+    reference_df, new_df: the reference and new data, cat_col: the categorical columns,
+    drift_pred: the results of the statistical tests, histograms: the output of compute_histograms,
+    top_k: the number of features to plot in the binned mode
+    outputs: plot_tasks: the list of (plot type, file name, plot arguments) tuples to render
+    '''
+    if plot_mode == 'summary':
+        return []
+
+    columns = list(reference_df.columns)
+    plot_tasks = [('heatmap', 'pvalues_summary.png', (columns, drift_pred['p_val']))]
+
+    if plot_mode == 'full':
+        features = columns
+    else:
+        features = select_plot_features(columns, drift_pred, top_k)
+
+    for col in features:
+        feature_drift = bool(drift_pred['is_drift'][columns.index(col)])
+        if plot_mode == 'full' and col in cat_col:
+            plot_tasks.append(('categorical', f'{col}_frequency.png',
+                               (reference_df[[col]], new_df[[col]], col, int(feature_drift))))
+        elif plot_mode == 'full':
+            plot_tasks.append(('kde', f'{col}_kde.png',
+                               (reference_df[col], new_df[col], f'{col}: drift: {feature_drift}')))
+        elif col in cat_col:
+            freq = pd.concat([histograms[col]['ref'], histograms[col]['new']], axis=1).fillna(0)
+            plot_tasks.append(('categorical_hist', f'{col}_frequency.png',
+                               (list(freq.index), freq.iloc[:, 0].to_numpy(), freq.iloc[:, 1].to_numpy(),
+                                f'{col}: drift detected: {feature_drift}')))
+        else:
+            histogram = histograms[col]
+            plot_tasks.append(('hist', f'{col}_hist.png',
+                               (histogram['edges'], histogram['ref'], histogram['new'],
+                                f'{col}: drift: {feature_drift}')))
+    return plot_tasks
 
-    logger = logging.getLogger(__name__)
-    logger.addHandler(AzureLogHandler(
-        connection_string=args.logger_connection_string))
 
-    mlflow.set_tracking_uri(args.mlflow_uri)
-    mlflow.start_run()
-    run_id = mlflow.active_run().info.run_id
+def build_feature_records(reference_df, new_df, cat_col, drift_pred, args, run_id, sample_sizes=None, histograms=None):
+    '''
+    This function is used to gather the per-feature results, so that they can be sent in bulk.
+    inputs: reference_df, new_df: the reference and new data, cat_col: the categorical columns,
+    drift_pred: the results of the statistical tests, args: the parsed arguments (see parse_args),
+    run_id: the MLflow run id, sample_sizes: the sample size required by each feature, if the data were sampled,
+    histograms: the output of compute_histograms, if computed
+    outputs: metrics: the MLflow metrics of all the features, feature_properties: the App Insights record
+    properties of each feature
+    '''
+    sample_sizes = sample_sizes or {}
+    sample_size = min(len(reference_df), len(new_df))
+    columns = list(reference_df.columns)
+    cat_cols_name = {columns.index(i) for i in cat_col}
 
-    reference_data_path = args.reference_data_path
-    new_data_path = args.new_data_path
-    #output_path = args.output_path
+    metrics = {}
+    feature_properties = []
+
+    for id, col in enumerate(columns):
+        feature_drift = int(drift_pred['is_drift'][id])
+        properties = {'custom_dimensions': {'model_name': args.model_name, 'model_version': args.model_version, 'feature_name': col, 'is_drift': feature_drift,
+                                            'distances': str(drift_pred['distance'][id]),
+                                            'p_values': str(drift_pred['p_val'][id]),
+                                            'run_id': run_id,
+                                            'sample_size': sample_size
+                                            }}
+        if col in sample_sizes:
+            properties['custom_dimensions']['required_sample_size'] = sample_sizes[col]
+
+        metrics.update({f'{col}_drift': feature_drift,
+                        f'{col}_distance': drift_pred['distance'][id],
+                        f'{col}_p_value': drift_pred['p_val'][id]})
+
+        if id in cat_cols_name:
+            feature_metrics = gen_categorical_metrics(
+                reference_df, new_df, col, histogram=histograms[col] if histograms else None)
+        else:
+            feature_metrics = gen_cont_metrics(reference_df, new_df, col)
+        properties['custom_dimensions'].update(feature_metrics)
+        feature_properties.append(properties)
+
+    return metrics, feature_properties
 
-    reference_df, new_df = read_data(reference_data_path, new_data_path)
 
+def test_drift(reference_df, new_df, args, run_id, sample_sizes=None):
+    '''
+    This function is used to run the drift tests and gather the results to log, without logging them.
+    inputs: reference_df, new_df: the reference and new data, args: the parsed arguments (see parse_args),
+    run_id: the MLflow run id, sample_sizes: the sample size required by each feature, if the data were sampled
+    outputs: results: a dictionary with the categorical columns (cat_col), the results of the statistical tests
+    (drift_pred), the histograms of the binned plot mode, the total record properties (properties), the MLflow
+    metrics and the App Insights record properties of each feature (feature_properties)
+    '''
     cat_col = get_category_columns(reference_df)  # get categorical columns
     is_drift, drift_pred = compare_distributions(reference_df, new_df, cat_col)
 
     severity_level = compute_severity_level(drift_pred)
     properties = {'custom_dimensions': {'is_drift': is_drift,
-                                        'severity': severity_level, 'run_id': run_id}}
-    logger.info(f'{args.model_name}_data_drift_total', extra=properties)
+                                        'severity': severity_level, 'run_id': run_id,
+                                        'sample_size': min(len(reference_df), len(new_df))}}
 
-    heatmap_fig = pval_heatmap(reference_df.columns, drift_pred['p_val'])
-    mlflow.log_figure(heatmap_fig, f'pvalues_summary.png')
+    histograms = None
+    if args.plot_mode == 'binned':
+        histograms = compute_histograms(reference_df, new_df, cat_col, bins=args.plot_bins)
 
-    for id, col in enumerate(reference_df.columns):
-        properties = {'custom_dimensions': {'model_name': args.model_name, 'model_version': args.model_version, 'feature_name': col, 'is_drift': int(drift_pred['is_drift'][id]),
-                                            'distances': str(drift_pred['distance'][id]),
-                                            'p_values': str(drift_pred['p_val'][id]),
-                                            'run_id': run_id
-                                            }}
+    metrics, feature_properties = build_feature_records(reference_df, new_df, cat_col, drift_pred, args, run_id,
+                                                        sample_sizes=sample_sizes, histograms=histograms)
+    return {'cat_col': cat_col, 'drift_pred': drift_pred, 'histograms': histograms, 'properties': properties,
+            'metrics': metrics, 'feature_properties': feature_properties}
 
-        mlflow.log_metrics({f'{col}_drift': int(drift_pred['is_drift'][id]),
-                            f'{col}_distance': drift_pred['distance'][id],
-                            f'{col}_p_value': drift_pred['p_val'][id]})
 
-        cat_cols_name = [list(reference_df.columns).index(i) for i in cat_col]
+def plot_drift(reference_df, new_df, results, args, plot_dir):
+    '''
+    This function is used to render the figures of the plot mode to a folder.
+    inputs: reference_df, new_df: the reference and new data, results: the output of test_drift,
+    args: the parsed arguments (see parse_args), plot_dir: the folder the figures are written to
+    outputs: plotted: whether any figure was rendered
+    '''
+    plot_tasks = build_plot_tasks(args.plot_mode, reference_df, new_df, results['cat_col'], results['drift_pred'],
+                                  histograms=results['histograms'], top_k=args.plot_top_k)
+    if not plot_tasks:
+        return False
+    # imported here so that the summary mode does not load matplotlib at all
+    from drift_plots import render_figures
 
-        if id in cat_cols_name:
-            fig = cat_bar_plot(reference_df, new_df, col,
-                               int(drift_pred['is_drift'][id]))
-            mlflow.log_figure(fig, f'{col}_frequency.png')
-            feature_metrics = gen_categorical_metrics(
-                reference_df, new_df, col)
-        else:
-            drift_detected = bool(drift_pred['is_drift'][id])
-            title = f'{col}: drift: {drift_detected}'
-            plt.figure()
-            fig = kde_plot(reference_df[col], new_df[col], title)
-            mlflow.log_figure(fig, f'{col}_kde.png')
-            feature_metrics = gen_cont_metrics(reference_df, new_df, col)
-        properties['custom_dimensions'].update(feature_metrics)
+    render_figures(plot_tasks, plot_dir, max_workers=args.plot_workers)
+    return True
+
+
+def log_drift(results, args, logger, plot_dir=None):
+    '''
+    This function is used to log the results of the drift tests to the active MLflow run and to the logger.
+    inputs: results: the output of test_drift, args: the parsed arguments (see parse_args),
+    logger: the logger the App Insights records are sent to, plot_dir: the folder of the figures to log, if any
+    '''
+    logger.info(f'{args.model_name}_data_drift_total', extra=results['properties'])
 
+    # a single batched call, mlflow splits it into as few requests as the tracking server allows
+    mlflow.log_metrics(results['metrics'])
+
+    # the handler exports the records in batches of telemetry_batch_size rather than one request per feature
+    for properties in results['feature_properties']:
         logger.info(f'{args.model_name}_data_drift_features', extra=properties)
+    for handler in logger.handlers:
+        handler.flush()
 
+    if plot_dir is not None:
+        mlflow.log_artifacts(plot_dir)
+
+
+def measure_drift(reference_df, new_df, args, logger, sample_sizes=None):
+    '''
+    This function is used to run the drift tests and log their results to the active MLflow run and to the logger.
+    inputs: reference_df, new_df: the reference and new data, args: the parsed arguments (see parse_args),
+    logger: the logger the App Insights records are sent to,
+    sample_sizes: the sample size required by each feature, if the data were sampled
+    '''
+    run_id = mlflow.active_run().info.run_id
+    results = test_drift(reference_df, new_df, args, run_id, sample_sizes=sample_sizes)
+    with tempfile.TemporaryDirectory() as plot_dir:
+        plotted = plot_drift(reference_df, new_df, results, args, plot_dir)
+        log_drift(results, args, logger, plot_dir if plotted else None)
 
-if __name__ == '__main__':
 
+def read_drift_data(args, read=None):
+    '''
+    Read the reference and new data in the mode selected by the arguments: rebuilt from the feature sketches
+    (--new_sketch_path), sampled to the target power (--sample_power), or whole.
+    inputs: args: the parsed arguments, read: optional function reading a whole table, e.g. from a cache of
+    the tables, read_data is used by default
+    outputs: reference_df, new_df: the data, sample_sizes: the sample size required by each feature when sampling
+    '''
+    if args.new_sketch_path is not None:
+        reference_df = (read or read_table)(args.reference_data_path)
+        new_df = sketch_to_frame(read_sketch_snapshots(args.new_sketch_path), reference_df,
+                                 get_category_columns(reference_df), max_rows=args.sketch_max_rows)
+        return reference_df, new_df, {}
+    if args.sample_power is not None:
+        return read_sampled_data(args.reference_data_path, args.new_data_path, args.sample_power,
+                                 args.sample_min_distance, args.sample_min_effect_size, args.sample_seed)
+    if read is None:
+        return (*read_data(args.reference_data_path, args.new_data_path), {})
+    return read(args.reference_data_path), read(args.new_data_path), {}
+
+
+def main(args):
+
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.INFO)
+    logger.addHandler(get_log_handler(args.logger_connection_string,
+                                      max_batch_size=args.telemetry_batch_size))
+
+    mlflow.set_tracking_uri(args.mlflow_uri)
+    mlflow.start_run()
+
+    #output_path = args.output_path
+
+    reference_df, new_df, sample_sizes = read_drift_data(args)
+
+    measure_drift(reference_df, new_df, args, logger, sample_sizes=sample_sizes)
+
+    mlflow.end_run()
+
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('--model_name', type=str, required=True)
     parser.add_argument('--reference_data_path', type=str)
     parser.add_argument('--new_data_path', type=str)
+    parser.add_argument('--new_sketch_path', type=str, default=None)
+    parser.add_argument('--sketch_max_rows', type=int, default=100000)
     parser.add_argument('--mlflow_uri', type=str, default='.')
     parser.add_argument('--logger_connection_string', type=str, default='.')
     parser.add_argument('--model_version', type=str)
-    args = parser.parse_args()
+    parser.add_argument('--telemetry_batch_size', type=int, default=100)
+    parser.add_argument('--plot_workers', type=int, default=None)
+    parser.add_argument('--plot_mode', type=str, default='full', choices=['full', 'binned', 'summary'])
+    parser.add_argument('--plot_top_k', type=int, default=None)
+    parser.add_argument('--plot_bins', type=int, default=30)
+    parser.add_argument('--sample_power', type=float, default=None)
+    parser.add_argument('--sample_min_distance', type=float, default=0.05)
+    parser.add_argument('--sample_min_effect_size', type=float, default=0.1)
+    parser.add_argument('--sample_seed', type=int, default=42)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
 
-    main(args)
+    main(parse_args())
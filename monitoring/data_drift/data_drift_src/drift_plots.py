@@ -0,0 +1,137 @@
+import os
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+import seaborn as sns
+from concurrent.futures import ProcessPoolExecutor
+
+
+def kde_plot(x_ref, x_new, title):
+    '''
+    Plot the distribution of the reference and new data using a kernel density estimate.
+    input: 
+    x_ref, x_new: the reference and new data
+    title: the title of the plot
+    output: fig: the figure object
+    '''
+    fig = Figure()
+    ax = fig.subplots()
+    sns.kdeplot(x_ref, shade=True, color='blue', label='reference', ax=ax)
+    sns.kdeplot(x_new, shade=True, color='red', label='new', ax=ax)
+    ax.set_title(title)
+    return fig
+
+
+def cat_bar_plot(reference_df, new_df, col, drift_detected):
+    '''
+    Plot the distribution of the reference and new data using a bar plot.
+    input: reference_df, new_df: the reference and new data
+    drift_detected: boolean indicating whether a drift was detected
+    output: fig: the figure object
+    '''
+    ref_counts = reference_df[col].value_counts(normalize=True).reset_index()
+    ref_counts['source'] = 'reference data'
+
+    new_counts = new_df[col].value_counts(normalize=True).reset_index()
+    new_counts['source'] = 'new data'
+
+    counts_df = pd.concat([ref_counts, new_counts])
+    fig = Figure()
+    ax = fig.subplots()
+    sns.barplot(x=col, y='index', hue='source', data=counts_df, ax=ax)
+    ax.set_title(f'{col}: drift detected: {bool(drift_detected)}')
+
+    return fig
+
+
+def pval_heatmap(col_name, p_vals):
+    '''
+    Plot the p values of the statistical tests used to detect the drift.
+    inputs:
+    col_name: the name of the columns
+    p_vals: the p values
+    output: fig: the figure object
+    '''
+    p_values = {col_name[i]: p_vals[i] for i in range(len(col_name))}
+
+    p_values = pd.DataFrame([p_values]).T
+
+    fig = Figure()
+    ax = fig.subplots()
+    sns.heatmap(p_values, annot=True, cmap=[
+                'red', 'blue'], center=0.05, ax=ax)
+    fig.suptitle('P vals summary')
+    return fig
+
+
+def hist_plot(edges, ref_density, new_density, title):
+    '''
+    Plot the distribution of the reference and new data from their pre-binned histograms.
+    input:
+    edges: the bin edges shared by both histograms
+    ref_density, new_density: the density of the reference and new data in each bin
+    title: the title of the plot
+    output: fig: the figure object
+    '''
+    fig = Figure()
+    ax = fig.subplots()
+    ax.stairs(ref_density, edges, fill=True, alpha=0.4, color='blue', label='reference')
+    ax.stairs(new_density, edges, fill=True, alpha=0.4, color='red', label='new')
+    ax.legend()
+    ax.set_title(title)
+    return fig
+
+
+def cat_hist_plot(categories, ref_freq, new_freq, title):
+    '''
+    Plot the category frequencies of the reference and new data from their pre-computed counts.
+    input:
+    categories: the category labels
+    ref_freq, new_freq: the relative frequency of each category in the reference and new data
+    title: the title of the plot
+    output: fig: the figure object
+    '''
+    positions = np.arange(len(categories))
+    fig = Figure()
+    ax = fig.subplots()
+    ax.barh(positions - 0.2, ref_freq, height=0.4, color='blue', label='reference data')
+    ax.barh(positions + 0.2, new_freq, height=0.4, color='red', label='new data')
+    ax.set_yticks(positions)
+    ax.set_yticklabels([str(c) for c in categories])
+    ax.legend()
+    ax.set_title(title)
+    return fig
+
+
+PLOT_FUNCTIONS = {'kde': kde_plot, 'categorical': cat_bar_plot, 'heatmap': pval_heatmap,
+                  'hist': hist_plot, 'categorical_hist': cat_hist_plot}
+
+
+def render_figure(plot_task, output_dir):
+    '''
+    Render a single figure and save it to the output directory.
+    input:
+    plot_task: a (plot type, file name, plot arguments) tuple, the plot type being a key of PLOT_FUNCTIONS
+    output_dir: the directory the figure is saved to
+    output: path: the path of the saved figure
+    '''
+    plot_type, file_name, plot_args = plot_task
+    fig = PLOT_FUNCTIONS[plot_type](*plot_args)
+    path = os.path.join(output_dir, file_name)
+    fig.savefig(path)
+    return path
+
+
+def render_figures(plot_tasks, output_dir, max_workers=None):
+    '''
+    Render the figures concurrently, each in a separate worker process.
+    input:
+    plot_tasks: the list of (plot type, file name, plot arguments) tuples to render
+    output_dir: the directory the figures are saved to
+    max_workers: the number of worker processes, defaults to the number of CPUs
+    output: paths: the paths of the saved figures
+    '''
+    if not plot_tasks:
+        return []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(render_figure, plot_tasks, [output_dir] * len(plot_tasks)))
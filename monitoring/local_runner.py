@@ -0,0 +1,152 @@
+import argparse
+import json
+import logging
+import os
+import sched
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mlflow
+
+MONITORING_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(MONITORING_DIR, "data_drift", "data_drift_src"))
+sys.path.insert(0, os.path.join(MONITORING_DIR, "model_performance", "model_performance_src"))
+
+import data_drift  # noqa: E402
+import model_performance  # noqa: E402
+
+with open(os.path.join(MONITORING_DIR, "config.json")) as f:
+    config = json.load(f)
+
+# the frequencies accepted by RecurrenceTrigger, in seconds
+FREQUENCY_SECONDS = {"minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60, "week": 7 * 24 * 60 * 60}
+
+
+class DatasetCache:
+    """
+    Keeps each input file in memory until it changes on disk, so that both monitors share a single copy
+    of the data and unchanged files (e.g. the reference data) are not read again on the next run.
+    """
+
+    def __init__(self):
+        self._frames = {}
+
+    def get(self, path):
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._frames.get(path)
+        if cached is None or cached[0] != version:
+            cached = (version, data_drift.read_table(path))
+            self._frames[path] = cached
+        return cached[1]
+
+
+def get_experiment_id(experiment_name):
+    client = mlflow.tracking.MlflowClient()
+    experiment = client.get_experiment_by_name(experiment_name)
+    if experiment is None:
+        return client.create_experiment(experiment_name)
+    return experiment.experiment_id
+
+
+def run_in_mlflow(experiment_id, measure, *measure_args):
+    # each monitor runs in its own thread, and so gets its own active MLflow run
+    with mlflow.start_run(experiment_id=experiment_id):
+        measure(*measure_args)
+
+
+def run_monitors(cache, data_folder, drift_args, performance_args, logger):
+    """
+    Runs the data drift and model performance monitors concurrently on the local files.
+    """
+    # the drift data is read in the mode selected by the data drift arguments (whole, sampled or from sketches)
+    reference_df, new_df, sample_sizes = data_drift.read_drift_data(drift_args, read=cache.get)
+    inference_df = cache.get(os.path.join(data_folder, config["inference_file_name"]))
+    groundtruth_df = cache.get(os.path.join(data_folder, config["ground_truth_file_name"]))
+    performance_df = model_performance.merge_data(inference_df, groundtruth_df, config["index_name"])
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        jobs = {
+            "data_drift": executor.submit(run_in_mlflow, get_experiment_id(config["experiment_name"]),
+                                          data_drift.measure_drift, reference_df, new_df, drift_args, logger,
+                                          sample_sizes),
+            "model_performance": executor.submit(run_in_mlflow, get_experiment_id(config["perf_experiment_name"]),
+                                                 model_performance.measure_performance, performance_df,
+                                                 performance_args, logger),
+        }
+        for name, job in jobs.items():
+            try:
+                job.result()
+            except Exception:
+                logger.exception(f"{config['model_name']}_{name} monitoring failed")
+
+
+def schedule(job, interval_seconds, max_runs=None):
+    """
+    Local replacement for the AML RecurrenceTrigger: runs the job now and then every interval_seconds.
+    Runs that would have started while the previous one was still running are skipped. A run that fails is
+    logged and the next run is scheduled as usual.
+
+    :param job: The function to run.
+    :param interval_seconds: The time between the start of two runs.
+    :param max_runs: Optional. The number of runs after which to stop, runs forever if not given.
+    """
+    scheduler = sched.scheduler(time.monotonic, time.sleep)
+
+    def run(run_number, start_time):
+        try:
+            job()
+        except Exception:
+            logging.getLogger(__name__).exception(f"Monitoring run {run_number} failed")
+        if max_runs is not None and run_number + 1 >= max_runs:
+            return
+        next_start_time = start_time + interval_seconds
+        while next_start_time < time.monotonic():
+            next_start_time += interval_seconds
+        scheduler.enterabs(next_start_time, 1, run, (run_number + 1, next_start_time))
+
+    scheduler.enterabs(time.monotonic(), 1, run, (0, time.monotonic()))
+    scheduler.run()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Runs the data drift and model performance monitors locally. "
+                    "Unknown arguments are passed on to the data drift script (e.g. --plot_mode summary).")
+    parser.add_argument("--data_folder", type=str, default=os.path.join(MONITORING_DIR, "sample_data"))
+    parser.add_argument("--mlflow_uri", type=str, default="file:./mlruns")
+    parser.add_argument("--logger_connection_string", type=str, default="local:telemetry.jsonl")
+    parser.add_argument("--frequency", type=str, default="minute", choices=list(FREQUENCY_SECONDS))
+    parser.add_argument("--interval", type=int, default=10)
+    parser.add_argument("--max_runs", type=int, default=None)
+    args, drift_argv = parser.parse_known_args()
+
+    common_argv = ["--model_name", config["model_name"],
+                   "--model_version", config["model_version"],
+                   "--mlflow_uri", args.mlflow_uri,
+                   "--logger_connection_string", args.logger_connection_string]
+    # the data drift parser rejects the arguments it does not know
+    drift_args = data_drift.parse_args(common_argv + [
+        "--reference_data_path", os.path.join(args.data_folder, config["reference_file_name"]),
+        "--new_data_path", os.path.join(args.data_folder, config["new_file_name"])] + drift_argv)
+    performance_args = model_performance.parse_args(common_argv + [
+        "--inference_data_path", os.path.join(args.data_folder, config["inference_file_name"]),
+        "--groundtruth_data_path", os.path.join(args.data_folder, config["ground_truth_file_name"]),
+        "--index_name", config["index_name"]])
+
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.INFO)
+    logger.addHandler(data_drift.get_log_handler(args.logger_connection_string,
+                                                 max_batch_size=drift_args.telemetry_batch_size))
+
+    mlflow.set_tracking_uri(args.mlflow_uri)
+    cache = DatasetCache()
+
+    schedule(lambda: run_monitors(cache, args.data_folder, drift_args, performance_args, logger),
+             args.interval * FREQUENCY_SECONDS[args.frequency], max_runs=args.max_runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import argparse
+import glob
 import mlflow
 import os
 import pandas as pd
@@ -8,17 +9,58 @@ from opencensus.ext.azure.log_exporter import AzureLogHandler
 from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
 
 
+# is_parquet, list_parquet_files and read_table are duplicated in data_drift_src/data_drift.py, as each
+# monitoring job only ships its own source folder: keep both copies identical.
+def is_parquet(path):
+    '''
+    Whether a path is a parquet file or a folder of parquet files, e.g. the inference capture of the model API.
+    '''
+    return os.path.isdir(path) or path.endswith('.parquet')
+
+
+def list_parquet_files(path):
+    '''
+    List the parquet files of a folder and its subfolders (e.g. date=YYYY-MM-DD/hour=HH/part-*.parquet), in order.
+    Hidden files, such as the files the inference capture is still writing, are skipped.
+    '''
+    if not os.path.isdir(path):
+        return [path]
+    files = sorted(glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True))
+    if not files:
+        raise FileNotFoundError(f'No parquet files found in {path}')
+    return files
+
+
+def read_table(path):
+    '''
+    Read a csv file, a parquet file or a folder of parquet files.
+    The files of a folder are read one by one, so that a column whose type changed between files can still be read.
+    '''
+    if not is_parquet(path):
+        return pd.read_csv(path)
+    return pd.concat([pd.read_parquet(file) for file in list_parquet_files(path)], ignore_index=True)
+
+
 def read_data(inference_data_path, groundtruth_data_path, index_name):
     '''
-    In the template, the assumption is that the data are stored in csv files,
+    In the template, the assumption is that the data are stored in csv files, or in parquet files
+    such as the inference capture of the model API.
     Change this function to read the data using the appropriate method for your data type.
 
     '''
-    inf_df = pd.read_csv(inference_data_path)
-    ground_df = pd.read_csv(groundtruth_data_path)
-    df = pd.merge(inf_df, ground_df, on=index_name, how='outer')
+    inf_df = read_table(inference_data_path)
+    ground_df = read_table(groundtruth_data_path)
+
+    return merge_data(inf_df, ground_df, index_name)
 
-    return df
+
+def merge_data(inf_df, ground_df, index_name):
+    '''
+    Join the predictions to their ground truth.
+    input: inf_df, ground_df: the inference and ground truth data, index_name: the column both are keyed by
+    output: df: the merged dataframe
+    '''
+    return pd.merge(inf_df, ground_df, on=index_name, how='outer')
 
 
 def get_metrics(df):
@@ -36,6 +78,23 @@ def get_metrics(df):
     return metrics_dict
 
 
+def measure_performance(df, args, logger):
+    '''
+    Compute the metrics of the model and log them to the active MLflow run and to the logger.
+    input: df: the merged predictions and ground truth, args: the parsed arguments (see parse_args),
+    logger: the logger the App Insights record is sent to
+    '''
+    run_id = mlflow.active_run().info.run_id
+
+    metrics = get_metrics(df)
+
+    mlflow.log_metrics(metrics)
+    metrics['run_id'] = run_id
+
+    properties = {'custom_dimensions': metrics}
+    logger.info(f'{args.model_name}_model_performance', extra=properties)
+
+
 def main(args):
     logger = logging.getLogger(__name__)
     logger.addHandler(AzureLogHandler(
@@ -43,22 +102,15 @@ def main(args):
 
     mlflow.set_tracking_uri(args.mlflow_uri)
     mlflow.start_run()
-    run_id = mlflow.active_run().info.run_id
 
     inference_data_path = args.inference_data_path
     groundtruth_data_path = args.groundtruth_data_path
 
     df = read_data(inference_data_path, groundtruth_data_path, args.index_name)
-    metrics = get_metrics(df)
-
-    mlflow.log_metrics(metrics)
-    metrics['run_id'] = run_id
-
-    properties = {'custom_dimensions': metrics}
-    logger.info(f'{args.model_name}_model_performance', extra=properties)
+    measure_performance(df, args, logger)
 
 
-if __name__ == '__main__':
+def parse_args(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('--model_name', type=str, required=True)
     parser.add_argument('--inference_data_path', type=str, required=True)
@@ -68,6 +120,8 @@ if __name__ == '__main__':
     parser.add_argument('--logger_connection_string', type=str, required=True)
     parser.add_argument('--model_version', type=str, required=False)
 
-    args = parser.parse_args()
+    return parser.parse_args(argv)
 
-    main(args)
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -13,9 +13,25 @@
 #  limitations under the License.
 
 import logging
+import os
+
+from model.src.transform import FeatureTransform
+
+# path to the feature_transform.json file stored with the model by model/src/train.py
+FEATURE_TRANSFORM_PATH_ENV = "FEATURE_TRANSFORM_PATH"
+
+feature_transform = None
+
 
 def init():
     # TODO: Perform any initialization of the model
+    global feature_transform
+    transform_path = os.environ.get(FEATURE_TRANSFORM_PATH_ENV)
+    if transform_path:
+        # the transform fitted on the training data, so that requests get exactly the features the model was
+        # trained on
+        feature_transform = FeatureTransform.load(transform_path)
+        logging.info(f"Feature transform loaded from {transform_path}")
     logging.info("Model initialized")
     return {"init": "DONE"}
 
@@ -24,6 +40,8 @@ def run(model_inputs: dict = None):
     # TODO: Add code here that calls your model
     #       model_inputs is a dictionary containing any inputs that were passed to the model endpoint
     #       This function should return a dictionary containing the model results
+    #       When FEATURE_TRANSFORM_PATH is set, feature_transform.transform(model_inputs) returns the features
+    #       the model was trained on, as a float32 array with one row per request row
     
     logging.info("Model run started")
     model_results = {"result": "Hello World!"}
@@ -13,11 +13,18 @@
 #  limitations under the License.
 
 import logging
-from fastapi import FastAPI
+import os
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from serve import entrypoint
 from .about import generate_about_json
 from .azure_logging import initialize_logging, disable_unwanted_loggers
+from .sketches import FeatureSketches
+from .capture import capture_from_environment
+from .debug import require_debug_token
+from . import profiler, tracing
 
 
 logger = logging.getLogger(__name__)
@@ -26,12 +33,69 @@ logger = logging.getLogger(__name__)
 # create fastapi app
 app = FastAPI()
 
+# streaming summaries of the model inputs, consumed by the data drift monitoring
+feature_sketches = FeatureSketches(
+    max_features=int(os.environ.get("FEATURE_SKETCHES_MAX_FEATURES", 100)),
+    feature_names=[name.strip() for name in os.environ.get("FEATURE_SKETCHES_FEATURES", "").split(",")
+                   if name.strip()] or None,
+)
+
+# copies of the inputs and results of the requests, read by the model performance monitoring (opt-in)
+inference_capture = capture_from_environment()
+
+# per-request traces, exported to Application Insights with tail-based sampling
+trace_recorder = tracing.TraceRecorder(
+    capacity=int(os.environ.get("TRACE_BUFFER_SIZE", 1000)),
+    slow_threshold_ms=float(os.environ.get("TRACE_SLOW_THRESHOLD_MS", 500)),
+    sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", 0.01)),
+)
+
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    trace = tracing.start_trace(request.method, request.url.path,
+                                request.headers.get(tracing.CORRELATION_ID_HEADER))
+    try:
+        response = await call_next(request)
+        trace.status_code = response.status_code
+    except Exception as e:
+        trace.error = repr(e)
+        raise
+    finally:
+        trace_recorder.finish(trace)
+    response.headers[tracing.CORRELATION_ID_HEADER] = trace.correlation_id
+    return response
+
 @app.on_event("startup")
 async def initialize_logging_on_startup():
     initialize_logging(logging.INFO)
     disable_unwanted_loggers()
 
 
+@app.on_event("startup")
+async def initialize_model_on_startup():
+    entrypoint.init()
+
+
+@app.on_event("startup")
+async def start_feature_sketches_on_startup():
+    # the sketches hold raw input values, so they are only kept when enabled explicitly
+    if os.environ.get("FEATURE_SKETCHES_ENABLED", "false").lower() == "true":
+        feature_sketches.start()
+
+
+@app.on_event("startup")
+async def start_inference_capture_on_startup():
+    if inference_capture is not None:
+        inference_capture.start()
+
+
+@app.on_event("shutdown")
+async def stop_inference_capture_on_shutdown():
+    if inference_capture is not None:
+        inference_capture.stop()
+
+
 @app.get("/")
 def root():
     logging.info("Root endpoint called")
@@ -39,6 +103,49 @@ def root():
 
 
 @app.get("/run")
-def run(rawdata: dict = None):
+async def run(rawdata: dict = None):
+    tracing.record_since_start("parse")
     logging.info("Run endpoint called")
-    return entrypoint.run(rawdata)
+    feature_sketches.submit(rawdata)
+    model_results = await tracing.run_in_threadpool_traced("run", entrypoint.run, rawdata)
+    if inference_capture is not None:
+        trace = tracing.current_trace()
+        inference_capture.submit(rawdata, model_results, request_id=trace.correlation_id if trace else None)
+    with tracing.span("serialise"):
+        return JSONResponse(content=jsonable_encoder(model_results))
+
+
+@app.get("/sketches", dependencies=[Depends(require_debug_token)])
+def sketches():
+    logging.info("Sketches endpoint called")
+    return feature_sketches.snapshot()
+
+
+@app.get("/capture")
+def capture():
+    logging.info("Capture endpoint called")
+    if inference_capture is None:
+        raise HTTPException(status_code=404, detail="Inference capture is disabled")
+    return inference_capture.stats()
+
+
+@app.get("/debug/profile", dependencies=[Depends(require_debug_token)])
+def profile(seconds: float = Query(10, gt=0, le=profiler.MAX_DURATION_SECONDS),
+            rate: int = Query(100, gt=0, le=profiler.MAX_SAMPLING_RATE),
+            allocations: int = Query(0, ge=0, le=100),
+            format: str = Query("json", regex="^(json|collapsed)$")):
+    logging.info(f"Profile endpoint called for {seconds}s at {rate}Hz")
+    try:
+        result = profiler.profile(seconds, rate=rate, allocations=allocations)
+    except profiler.ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if format == "collapsed":
+        return PlainTextResponse("\n".join(result["collapsed"]) + "\n")
+    return result
+
+
+@app.get("/debug/traces", dependencies=[Depends(require_debug_token)])
+def traces(limit: int = Query(100, gt=0, le=10000), exported_only: bool = False):
+    return {"exported": trace_recorder.exported, "sampled_out": trace_recorder.sampled_out,
+            "traces": trace_recorder.recent(limit, exported_only=exported_only)}
@@ -3,9 +3,11 @@ from typing import Optional
 
 from opencensus.ext.azure.log_exporter import AzureLogHandler
 from opencensus.trace import config_integration
-from opencensus.trace.samplers import AlwaysOnSampler
+from opencensus.trace.samplers import AlwaysOffSampler
 from opencensus.trace.tracer import Tracer
 
+from .tracing import TraceContextFilter
+
 UNWANTED_LOGGERS = [
     "azure.core.pipeline.policies.http_logging_policy",
     "azure.eventhub._eventprocessor.event_processor",
@@ -70,6 +72,8 @@ def initialize_logging(logging_level: int, correlation_id: Optional[str] = None)
         # picks up APPLICATIONINSIGHTS_CONNECTION_STRING automatically
         azurelog_handler = AzureLogHandler()
         azurelog_handler.add_telemetry_processor(telemetry_processor_callback_function)
+        # the records of a request take its trace ID as their operation_Id
+        azurelog_handler.addFilter(TraceContextFilter())
         azurelog_handler.addFilter(ExceptionTracebackFilter())
         logger.addHandler(azurelog_handler)
     except ValueError as e:
@@ -77,7 +81,9 @@ def initialize_logging(logging_level: int, correlation_id: Optional[str] = None)
 
     config_integration.trace_integrations(['logging'])
     logging.basicConfig(level=logging_level, format='%(asctime)s %(message)s')
-    Tracer(sampler=AlwaysOnSampler())
+    # spans are recorded per request and exported with tail-based sampling (see tracing.py), the trace ID of
+    # each request is set on its log records by TraceContextFilter
+    Tracer(sampler=AlwaysOffSampler())
     logger.setLevel(logging_level)
 
     extra = {}
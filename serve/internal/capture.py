@@ -0,0 +1,254 @@
+#  Copyright (c) University College London Hospitals NHS Foundation Trust
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# columns added to every captured row, next to the model inputs and results
+REQUEST_ID_COLUMN = "request_id"
+TIMESTAMP_COLUMN = "timestamp"
+MODEL_VERSION_COLUMN = "model_version"
+RESERVED_COLUMNS = (REQUEST_ID_COLUMN, TIMESTAMP_COLUMN, MODEL_VERSION_COLUMN)
+
+# prefixes of the inputs and results whose names clash with the columns above, or results clashing with inputs
+INPUT_PREFIX = "input."
+OUTPUT_PREFIX = "output."
+
+_STOP = object()
+
+
+def _to_column(values: list) -> pa.Array:
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # mixed types, e.g. a feature sent as a number by some clients and as a string by others
+        return pa.array([None if value is None else str(value) for value in values], type=pa.string())
+
+
+def _batch_size(values: dict) -> Optional[int]:
+    # a batch holds one list per input, all of the same length; single rows and ragged lists are not batches
+    lengths = {len(value) for value in values.values() if isinstance(value, (list, tuple))}
+    return lengths.pop() if len(lengths) == 1 else None
+
+
+def _split_rows(values: dict, n_rows: int) -> List[dict]:
+    # the lists of n_rows values are split across the rows, any other value is repeated on every row
+    return [{name: value[i] if isinstance(value, (list, tuple)) and len(value) == n_rows else value
+             for name, value in values.items()} for i in range(n_rows)]
+
+
+class ColumnarBuffer:
+    """
+    Captured rows, stored column by column. Columns that first appear after some rows were added are
+    back-filled with missing values, so that every column has one value per row.
+    """
+
+    def __init__(self):
+        self.columns: Dict[str, list] = {}
+        self.rows = 0
+
+    def append(self, row: dict):
+        for name, value in row.items():
+            if name not in self.columns:
+                self.columns[name] = [None] * self.rows
+            if isinstance(value, (dict, list, tuple)):
+                value = json.dumps(value, default=str)
+            self.columns[name].append(value)
+        self.rows += 1
+        for values in self.columns.values():
+            if len(values) < self.rows:
+                values.append(None)
+
+    def to_table(self) -> pa.Table:
+        return pa.table({name: _to_column(values) for name, values in self.columns.items()})
+
+
+class InferenceCapture:
+    """
+    Copies the inputs and results of every request to Parquet files, in the layout read by the monitoring jobs:
+    <output_dir>/date=YYYY-MM-DD/hour=HH/part-*.parquet. Each row holds the inputs and results of a request, keyed
+    by the ID passed in the inputs (e.g. id) or by the correlation ID of the request (request_id). A batch request,
+    holding a list of values per input, is stored as one row per input row under the same request_id, its results
+    being split the same way when they are lists of as many values. Inputs named like the request_id, timestamp and
+    model_version columns are stored as input.<name>, and results named like these columns or like an input as
+    output.<name>.
+
+    Requests are handed over through a bounded queue and the files are written on a background thread, so the
+    request path never waits on the disk; when the writer falls behind and the queue is full, the rows of the
+    request are dropped and counted. Rows are buffered in memory and written to a new file once max_rows_per_file rows are buffered,
+    flush_interval seconds after the first buffered row, or when the hour changes. Each file is written under a
+    temporary name and renamed once complete, so readers never see a partial file.
+    """
+
+    def __init__(self, output_dir: str, model_version: Optional[str] = None, max_rows_per_file: int = 100000, flush_interval: float = 300, max_queue_size: int = 10000):
+        self.output_dir = output_dir
+        self.model_version = model_version
+        self.max_rows_per_file = max_rows_per_file
+        self.flush_interval = flush_interval
+        self.captured = 0
+        self.dropped = 0
+        self.written_rows = 0
+        self.written_files = 0
+        self.write_errors = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._buffer = ColumnarBuffer()
+        self._buffer_partition: Optional[str] = None
+        self._buffer_started: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """
+        Starts the background thread writing the files.
+        """
+        if self._thread is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self._thread = threading.Thread(target=self._consume, name="inference-capture", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 30):
+        """
+        Writes the queued and buffered rows and stops the background thread.
+
+        :param timeout: The maximum time to wait for the writer, in seconds.
+        """
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, model_inputs: Optional[dict], model_results, request_id: Optional[str] = None):
+        """
+        Queues the inputs and results of a request, without blocking.
+
+        :param model_inputs: The dictionary of inputs passed to the model.
+        :param model_results: The results returned by the model, a dictionary (e.g. with pred and pred_proba).
+        :param request_id: Optional. The correlation ID of the request, a new ID is generated if not given.
+        """
+        if self._thread is None:
+            return
+        inputs = {}
+        if isinstance(model_inputs, dict):
+            for name, value in model_inputs.items():
+                inputs[INPUT_PREFIX + name if name in RESERVED_COLUMNS else name] = value
+        if not isinstance(model_results, dict):
+            model_results = {"result": model_results}
+        results = {}
+        for name, value in model_results.items():
+            results[OUTPUT_PREFIX + name if name in RESERVED_COLUMNS or name in inputs else name] = value
+
+        n_rows = _batch_size(inputs)
+        if n_rows is None:
+            rows = [dict(inputs, **results)]
+        else:
+            rows = [dict(row_inputs, **row_results) for row_inputs, row_results
+                    in zip(_split_rows(inputs, n_rows), _split_rows(results, n_rows))]
+        # the metadata columns are set last, so that no input or result can overwrite them
+        metadata = {REQUEST_ID_COLUMN: request_id or uuid.uuid4().hex, TIMESTAMP_COLUMN: datetime.now(timezone.utc),
+                    MODEL_VERSION_COLUMN: self.model_version}
+        for row in rows:
+            row.update(metadata)
+        try:
+            self._queue.put_nowait(rows)
+            self.captured += len(rows)
+        except queue.Full:
+            self.dropped += len(rows)
+
+    def _consume(self):
+        while True:
+            timeout = None
+            if self._buffer_started is not None:
+                timeout = max(0.0, self._buffer_started + self.flush_interval - time.monotonic())
+            try:
+                rows = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self.flush()
+                continue
+            if rows is _STOP:
+                self.flush()
+                return
+            for row in rows:
+                try:
+                    self._add(row)
+                except Exception:
+                    # a row that cannot be buffered must not stop the writer thread
+                    self.write_errors += 1
+                    logger.exception("Failed to buffer a captured row")
+
+    def _add(self, row: dict):
+        partition = row[TIMESTAMP_COLUMN].strftime("date=%Y-%m-%d/hour=%H")
+        if partition != self._buffer_partition:
+            self.flush()
+            self._buffer_partition = partition
+        if self._buffer_started is None:
+            self._buffer_started = time.monotonic()
+        self._buffer.append(row)
+        if self._buffer.rows >= self.max_rows_per_file:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered rows to a new file. Only called from the writer thread.
+        """
+        buffer, partition = self._buffer, self._buffer_partition
+        self._buffer, self._buffer_started = ColumnarBuffer(), None
+        if buffer.rows == 0:
+            return
+
+        directory = os.path.join(self.output_dir, partition)
+        name = f"part-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}.parquet"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            temporary_path = os.path.join(directory, f".{name}.tmp")
+            pq.write_table(buffer.to_table(), temporary_path)
+            os.replace(temporary_path, os.path.join(directory, name))
+            self.written_rows += buffer.rows
+            self.written_files += 1
+        except Exception:
+            self.write_errors += 1
+            logger.exception(f"Failed to write {buffer.rows} captured rows to {directory}")
+
+    def stats(self) -> dict:
+        return {"captured": self.captured, "dropped": self.dropped, "queued": self._queue.qsize(),
+                "written_rows": self.written_rows, "written_files": self.written_files,
+                "write_errors": self.write_errors}
+
+
+def capture_from_environment() -> Optional[InferenceCapture]:
+    """
+    Creates the inference capture if INFERENCE_CAPTURE_DIR is set, configured from the environment.
+
+    :returns: The inference capture, or None if capture is disabled.
+    """
+    output_dir = os.environ.get("INFERENCE_CAPTURE_DIR")
+    if not output_dir:
+        return None
+    return InferenceCapture(
+        output_dir,
+        model_version=os.environ.get("MODEL_VERSION"),
+        max_rows_per_file=int(os.environ.get("INFERENCE_CAPTURE_MAX_ROWS_PER_FILE", 100000)),
+        flush_interval=float(os.environ.get("INFERENCE_CAPTURE_FLUSH_SECONDS", 300)),
+        max_queue_size=int(os.environ.get("INFERENCE_CAPTURE_QUEUE_SIZE", 10000)),
+    )
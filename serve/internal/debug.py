@@ -0,0 +1,38 @@
+#  Copyright (c) University College London Hospitals NHS Foundation Trust
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hmac
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+# the debug endpoints are only enabled when this environment variable holds a token
+DEBUG_TOKEN_ENV = "DEBUG_ENDPOINTS_TOKEN"
+
+
+def require_debug_token(authorization: Optional[str] = Header(None)):
+    """
+    FastAPI dependency protecting the debug endpoints with a bearer token.
+    When no token is configured the endpoints respond as if they did not exist.
+
+    :param authorization: The Authorization header of the request, e.g. "Bearer <token>".
+    """
+    token = os.environ.get(DEBUG_TOKEN_ENV)
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    expected = f"Bearer {token}".encode()
+    if authorization is None or not hmac.compare_digest(authorization.encode(), expected):
+        raise HTTPException(status_code=401, detail="Unauthorized", headers={"WWW-Authenticate": "Bearer"})
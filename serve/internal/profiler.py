@@ -0,0 +1,112 @@
+#  Copyright (c) University College London Hospitals NHS Foundation Trust
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import List, Optional
+
+MAX_DURATION_SECONDS = 60
+MAX_SAMPLING_RATE = 1000
+MAX_STACK_DEPTH = 128
+
+# only one profile runs at a time, so that concurrent calls cannot add up their overhead
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusyError(Exception):
+    """
+    Raised when a profile is requested while another one is running.
+    """
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def sample_stacks(duration: float, rate: int) -> dict:
+    """
+    Samples the Python stacks of all the threads of the process, except the sampling thread itself.
+    Nothing is instrumented: the overhead is one walk of each thread's stack per sample, bounded by the rate.
+
+    :param duration: The sampling duration, in seconds.
+    :param rate: The number of samples per second.
+    :returns: The collapsed stacks ("thread;outer;...;inner" -> number of samples) and the number of samples taken.
+    """
+    interval = 1.0 / rate
+    own_thread = threading.get_ident()
+    stacks: Counter = Counter()
+    samples = 0
+
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            names: List[str] = []
+            while frame is not None and len(names) < MAX_STACK_DEPTH:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            names.append(thread_names.get(thread_id, str(thread_id)))
+            stacks[";".join(reversed(names))] += 1
+        samples += 1
+        time.sleep(interval)
+
+    return {"samples": samples, "stacks": stacks}
+
+
+def profile(duration: float, rate: int = 100, allocations: int = 0) -> dict:
+    """
+    Profiles the process for the given duration.
+
+    :param duration: The profiling duration, in seconds, at most MAX_DURATION_SECONDS.
+    :param rate: The number of stack samples per second, at most MAX_SAMPLING_RATE.
+    :param allocations: Optional. If positive, memory allocations are also traced during the profile and the
+        source lines that allocated the most are returned, up to this number.
+    :returns: The profile, with the collapsed stacks in the format used by flamegraph.pl and speedscope.
+    :raises ProfilerBusyError: If another profile is running.
+    """
+    duration = min(duration, MAX_DURATION_SECONDS)
+    rate = min(rate, MAX_SAMPLING_RATE)
+
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("A profile is already running")
+    started_tracemalloc = False
+    try:
+        if allocations > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracemalloc = True
+
+        start = time.monotonic()
+        result = sample_stacks(duration, rate)
+        elapsed = time.monotonic() - start
+
+        top_allocations: Optional[list] = None
+        if allocations > 0:
+            snapshot = tracemalloc.take_snapshot()
+            top_allocations = [{"location": str(stat.traceback), "size_kb": stat.size / 1024, "count": stat.count}
+                               for stat in snapshot.statistics("lineno")[:allocations]]
+    finally:
+        if started_tracemalloc:
+            tracemalloc.stop()
+        _profile_lock.release()
+
+    return {"duration": elapsed, "rate": rate, "samples": result["samples"],
+            "collapsed": [f"{stack} {count}" for stack, count in result["stacks"].most_common()],
+            "allocations": top_allocations}
@@ -0,0 +1,342 @@
+#  Copyright (c) University College London Hospitals NHS Foundation Trust
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hashlib
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MomentsSketch:
+    """
+    Count, mean and variance of a numeric feature (Welford's algorithm), plus its min and max.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def update(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "MomentsSketch"):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def to_dict(self) -> dict:
+        variance = self.m2 / (self.count - 1) if self.count > 1 else 0.0
+        return {"count": self.count, "mean": self.mean, "m2": self.m2, "variance": variance,
+                "min": self.min, "max": self.max}
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch in the style of KLL. Items are kept in levels, an item at level i standing for 2**i
+    values. When a level holds k items it is sorted and every other item is promoted to the next level, so the
+    memory used is about k * log2(n / k) items for n values, and the rank error is of the order of 1 / k.
+    """
+
+    def __init__(self, k: int = 128, seed: Optional[int] = None):
+        self.k = k
+        self.count = 0
+        self.levels: List[List[float]] = [[]]
+        self._random = random.Random(seed)
+
+    def update(self, value: float):
+        self.count += 1
+        self.levels[0].append(value)
+        if len(self.levels[0]) >= self.k:
+            self._compact()
+
+    def merge(self, other: "QuantileSketch"):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append([])
+            self.levels[level].extend(items)
+        self.count += other.count
+        self._compact()
+
+    def _compact(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self.k:
+                items.sort()
+                # an odd item out stays at this level
+                leftover = [items.pop()] if len(items) % 2 else []
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                self.levels[level + 1].extend(items[self._random.randint(0, 1)::2])
+                self.levels[level] = leftover
+            level += 1
+
+    def weighted_items(self) -> List[tuple]:
+        return sorted((value, 2 ** level) for level, items in enumerate(self.levels) for value in items)
+
+    def quantiles(self, probabilities: List[float]) -> List[Optional[float]]:
+        items = self.weighted_items()
+        if not items:
+            return [None for _ in probabilities]
+        total = sum(weight for _, weight in items)
+        results = []
+        for probability in probabilities:
+            target, cumulative = probability * total, 0
+            for value, weight in items:
+                cumulative += weight
+                if cumulative >= target:
+                    break
+            results.append(value)
+        return results
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "count": self.count, "levels": [list(items) for items in self.levels]}
+
+
+class CountMinSketch:
+    """
+    Count-min sketch of the values of a categorical feature. The hashes do not depend on the process, so that the
+    tables of different workers can be added together. The most frequent values are also tracked by name, with their
+    estimated counts, so that the sketch can be read without knowing the categories in advance.
+    """
+
+    def __init__(self, width: int = 1024, depth: int = 4, max_heavy_hitters: int = 100):
+        self.width = width
+        self.depth = depth
+        self.max_heavy_hitters = max_heavy_hitters
+        self.count = 0
+        self.table = [[0] * width for _ in range(depth)]
+        self.heavy_hitters: Dict[str, int] = {}
+
+    def _buckets(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4 * self.depth).digest()
+        return [int.from_bytes(digest[4 * row:4 * row + 4], "little") % self.width for row in range(self.depth)]
+
+    def update(self, key: str, count: int = 1):
+        self.count += count
+        estimate = None
+        for row, bucket in enumerate(self._buckets(key)):
+            self.table[row][bucket] += count
+            estimate = self.table[row][bucket] if estimate is None else min(estimate, self.table[row][bucket])
+        self._track(key, estimate)
+
+    def estimate(self, key: str) -> int:
+        return min(self.table[row][bucket] for row, bucket in enumerate(self._buckets(key)))
+
+    def _track(self, key: str, estimate: int):
+        if key in self.heavy_hitters or len(self.heavy_hitters) < self.max_heavy_hitters:
+            self.heavy_hitters[key] = estimate
+            return
+        smallest = min(self.heavy_hitters, key=self.heavy_hitters.get)
+        if estimate > self.heavy_hitters[smallest]:
+            del self.heavy_hitters[smallest]
+            self.heavy_hitters[key] = estimate
+
+    def merge(self, other: "CountMinSketch"):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Count-min sketches of different sizes cannot be merged")
+        self.count += other.count
+        for row in range(self.depth):
+            self.table[row] = [a + b for a, b in zip(self.table[row], other.table[row])]
+        for key in set(self.heavy_hitters) | set(other.heavy_hitters):
+            self._track(key, self.estimate(key))
+
+    def to_dict(self) -> dict:
+        return {"width": self.width, "depth": self.depth, "count": self.count,
+                "table": self.table, "heavy_hitters": dict(self.heavy_hitters)}
+
+
+class FeatureSketch:
+    """
+    The sketches of a single input feature: numeric values update the moments and quantile sketches,
+    strings and booleans the count-min sketch, and missing values are counted.
+    Each sketch is only created once the feature receives a value of its kind.
+    """
+
+    def __init__(self):
+        self.moments: Optional[MomentsSketch] = None
+        self.quantiles: Optional[QuantileSketch] = None
+        self.categories: Optional[CountMinSketch] = None
+        self.missing = 0
+
+    def update(self, value) -> bool:
+        """
+        Adds a value of the feature to the sketches.
+
+        :param value: The value of the feature in one row.
+        :returns: False if the value is of a kind that is not sketched, e.g. a dictionary.
+        """
+        if value is None:
+            self.missing += 1
+        elif isinstance(value, (bool, str)):
+            if self.categories is None:
+                self.categories = CountMinSketch()
+            self.categories.update(str(value))
+        elif isinstance(value, (int, float)):
+            if self.moments is None:
+                self.moments, self.quantiles = MomentsSketch(), QuantileSketch()
+            self.moments.update(float(value))
+            self.quantiles.update(float(value))
+        else:
+            return False
+        return True
+
+    def merge(self, other: "FeatureSketch"):
+        if other.moments is not None:
+            if self.moments is None:
+                self.moments, self.quantiles = MomentsSketch(), QuantileSketch(k=other.quantiles.k)
+            self.moments.merge(other.moments)
+            self.quantiles.merge(other.quantiles)
+        if other.categories is not None:
+            if self.categories is None:
+                self.categories = CountMinSketch(other.categories.width, other.categories.depth,
+                                                 other.categories.max_heavy_hitters)
+            self.categories.merge(other.categories)
+        self.missing += other.missing
+
+    def to_dict(self) -> dict:
+        sketch = {"missing": self.missing}
+        if self.moments is not None:
+            sketch["moments"] = self.moments.to_dict()
+            sketch["quantiles"] = self.quantiles.to_dict()
+        if self.categories is not None:
+            sketch["categories"] = self.categories.to_dict()
+        return sketch
+
+
+class FeatureSketches:
+    """
+    Fixed-memory summaries of the distribution of the input features passed to the model.
+    Requests are handed over through a bounded queue and the sketches are updated on a background thread,
+    so the request path never waits on them; when the queue is full the inputs are dropped and counted.
+    Only the declared features are sketched, or the first max_features names seen when none are declared,
+    so that requests with arbitrary keys cannot grow the memory used; the values of other names, and values of a kind that is not sketched, are counted.
+    A request holding lists of values, one per row, is sketched row by row, and the rows are counted alongside
+    the requests.
+
+    :param max_queue_size: The number of requests waiting to be sketched before new ones are dropped.
+    :param max_features: The maximum number of features sketched when feature_names is not given.
+    :param feature_names: Optional. The names of the features to sketch, all the others are ignored.
+    """
+
+    def __init__(self, max_queue_size: int = 10000, max_features: int = 100,
+                 feature_names: Optional[List[str]] = None):
+        self.features: Dict[str, FeatureSketch] = {}
+        self.feature_names = set(feature_names) if feature_names else None
+        self.max_features = max_features
+        self.requests = 0
+        self.rows = 0
+        self.dropped = 0
+        self.ignored_values = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """
+        Starts the background thread updating the sketches.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._consume, name="feature-sketches", daemon=True)
+            self._thread.start()
+
+    def submit(self, model_inputs: Optional[dict]):
+        """
+        Queues the inputs of a request, without blocking.
+
+        :param model_inputs: The dictionary of inputs passed to the model.
+        """
+        if not isinstance(model_inputs, dict) or self._thread is None:
+            return
+        try:
+            self._queue.put_nowait(model_inputs)
+        except queue.Full:
+            self.dropped += 1
+
+    def _consume(self):
+        while True:
+            model_inputs = self._queue.get()
+            try:
+                self.update(model_inputs)
+            except Exception:
+                logger.exception("Failed to update the feature sketches")
+
+    def _sketch(self, name: str) -> Optional[FeatureSketch]:
+        # the sketch of a feature, created on first use if the feature is tracked and the limit is not reached
+        sketch = self.features.get(name)
+        if sketch is None:
+            if self.feature_names is not None:
+                if name not in self.feature_names:
+                    return None
+            elif len(self.features) >= self.max_features:
+                return None
+            sketch = self.features[name] = FeatureSketch()
+        return sketch
+
+    def update(self, model_inputs: dict):
+        # a batch request holds a list of values per feature, a single request one value per feature
+        lengths = [len(value) for value in model_inputs.values() if isinstance(value, (list, tuple))]
+        with self._lock:
+            self.requests += 1
+            self.rows += max(lengths, default=1)
+            for name, value in model_inputs.items():
+                values = value if isinstance(value, (list, tuple)) else [value]
+                sketch = self._sketch(name)
+                if sketch is None:
+                    self.ignored_values += len(values)
+                    continue
+                for row_value in values:
+                    if not sketch.update(row_value):
+                        self.ignored_values += 1
+
+    def merge(self, other: "FeatureSketches"):
+        with self._lock:
+            self.requests += other.requests
+            self.rows += other.rows
+            self.dropped += other.dropped
+            self.ignored_values += other.ignored_values
+            for name, other_sketch in other.features.items():
+                sketch = self._sketch(name)
+                if sketch is not None:
+                    sketch.merge(other_sketch)
+
+    def snapshot(self) -> dict:
+        """
+        Returns a JSON-serialisable copy of the sketches. Snapshots of several workers can be combined by the
+        consumer: the moments and count-min tables add up, and the quantile items of all workers can be pooled.
+        """
+        with self._lock:
+            return {"worker_id": os.getpid(), "created": time.time(), "requests": self.requests,
+                    "rows": self.rows, "dropped": self.dropped, "queued": self._queue.qsize(), "ignored_values": self.ignored_values,
+                    "features": {name: sketch.to_dict() for name, sketch in self.features.items()}}
@@ -0,0 +1,199 @@
+#  Copyright (c) University College London Hospitals NHS Foundation Trust
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+CORRELATION_ID_HEADER = "x-correlation-id"
+
+logger = logging.getLogger(__name__)
+
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("current_trace", default=None)
+
+
+def _trace_id_from_correlation_id(correlation_id: Optional[str]) -> str:
+    """
+    App Insights operation IDs are 32 lowercase hex characters: correlation IDs in that format or UUIDs are
+    used as they are, anything else gets a new trace ID (the correlation ID is still recorded with the trace).
+    """
+    if correlation_id:
+        candidate = correlation_id.replace("-", "").lower()
+        if re.fullmatch(r"[0-9a-f]{32}", candidate) and candidate != "0" * 32:
+            return candidate
+    return uuid.uuid4().hex
+
+
+class RequestTrace:
+    """
+    The spans of a single request, as (name, start, end) tuples of time.perf_counter() values.
+    """
+
+    def __init__(self, method: str, path: str, correlation_id: Optional[str] = None):
+        self.trace_id = _trace_id_from_correlation_id(correlation_id)
+        self.correlation_id = correlation_id or self.trace_id
+        self.method = method
+        self.path = path
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.status_code: Optional[int] = None
+        self.error: Optional[str] = None
+        self.exported = False
+        self.spans: List[tuple] = []
+
+    def add_span(self, name: str, start: float, end: float):
+        self.spans.append((name, start, end))
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.trace_id, "correlation_id": self.correlation_id, "method": self.method,
+                "path": self.path, "timestamp": self.timestamp, "status_code": self.status_code,
+                "error": self.error, "duration_ms": self.duration_ms, "exported": self.exported,
+                "spans": [{"name": name, "offset_ms": (start - self.start) * 1000, "duration_ms": (end - start) * 1000}
+                          for name, start, end in self.spans]}
+
+
+class TraceRecorder:
+    """
+    Keeps the traces of the last requests in a ring buffer and exports them with tail-based sampling:
+    once a request is complete, it is exported to Application Insights if it failed or was slower than
+    slow_threshold_ms, and otherwise only with probability sample_rate.
+    """
+
+    def __init__(self, capacity: int = 1000, slow_threshold_ms: float = 500, sample_rate: float = 0.01):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.sample_rate = sample_rate
+        self.exported = 0
+        self.sampled_out = 0
+        self._buffer: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def should_export(self, trace: RequestTrace) -> bool:
+        if trace.error is not None or (trace.status_code or 500) >= 500:
+            return True
+        if trace.duration_ms >= self.slow_threshold_ms:
+            return True
+        return random.random() < self.sample_rate
+
+    def finish(self, trace: RequestTrace):
+        trace.end = time.perf_counter()
+        trace.exported = self.should_export(trace)
+        with self._lock:
+            self._buffer.append(trace)
+            if trace.exported:
+                self.exported += 1
+            else:
+                self.sampled_out += 1
+
+        if trace.exported:
+            custom_dimensions = {"trace_id": trace.trace_id, "correlation_id": trace.correlation_id,
+                                 "method": trace.method, "path": trace.path, "status_code": trace.status_code,
+                                 "error": trace.error, "duration_ms": trace.duration_ms}
+            for name, start, end in trace.spans:
+                custom_dimensions[f"span_{name}_ms"] = (end - start) * 1000
+            custom_dimensions["spans"] = json.dumps(trace.to_dict()["spans"])
+            # traceId becomes the operation_Id of the record in App Insights
+            logger.info("request_trace", extra={"custom_dimensions": custom_dimensions, "traceId": trace.trace_id})
+
+    def recent(self, limit: int = 100, exported_only: bool = False) -> List[dict]:
+        with self._lock:
+            traces = list(self._buffer)
+        if exported_only:
+            traces = [trace for trace in traces if trace.exported]
+        return [trace.to_dict() for trace in traces[-limit:]]
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def start_trace(method: str, path: str, correlation_id: Optional[str] = None) -> RequestTrace:
+    """
+    Starts the trace of a request and makes it the current trace. The trace ID also becomes the
+    operation_Id of the logs emitted while handling the request (see TraceContextFilter).
+    """
+    trace = RequestTrace(method, path, correlation_id)
+    _current_trace.set(trace)
+    return trace
+
+
+class TraceContextFilter(logging.Filter):
+    """
+    Sets the trace ID of the current request, if any, as the traceId of the log records, which App Insights uses
+    as their operation_Id. The opencensus logging integration only covers the loggers created after it, not the
+    root logger the request logs go through.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = current_trace()
+        if trace is not None:
+            record.traceId = trace.trace_id
+        return True
+
+
+def record_since_start(name: str):
+    """
+    Records a span from the start of the current request until now, e.g. the parsing of the request.
+    """
+    trace = current_trace()
+    if trace is not None:
+        trace.add_span(name, trace.start, time.perf_counter())
+
+
+@contextmanager
+def span(name: str):
+    """
+    Records the enclosed block as a span of the current request.
+    """
+    trace = current_trace()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.add_span(name, start, time.perf_counter())
+
+
+async def run_in_threadpool_traced(name: str, func, *args):
+    """
+    Runs func in the threadpool, recording the time spent waiting for a thread as a "queue" span
+    and the call itself as a span with the given name.
+    """
+    trace = current_trace()
+    submitted = time.perf_counter()
+
+    def call():
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            if trace is not None:
+                trace.add_span("queue", submitted, started)
+                trace.add_span(name, started, time.perf_counter())
+
+    return await run_in_threadpool(call)
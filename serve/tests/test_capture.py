@@ -0,0 +1,72 @@
+#  Copyright (c) University College London Hospitals NHS Foundation Trust
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "monitoring", "model_performance", "model_performance_src"))
+
+from serve.internal.capture import InferenceCapture  # noqa: E402
+from model_performance import merge_data, read_table  # noqa: E402
+
+"""
+Checks that the rows captured by the model API can be read back and joined to their ground truth by the
+monitoring jobs.
+"""
+
+
+@pytest.fixture
+def capture(tmp_path):
+    capture = InferenceCapture(str(tmp_path / "capture"), model_version="1")
+    capture.start()
+    return capture
+
+
+def test_single_and_batch_requests_merge_with_ground_truth(capture):
+    for i in range(5):
+        capture.submit({"id": i, "heat_deviation": 0.5 * i}, {"pred": i % 2, "pred_proba": 0.1 * i},
+                       request_id=f"single-{i}")
+    capture.submit({"id": [5, 6, 7], "heat_deviation": [1.0, None, 2.0]},
+                   {"pred": [1, 0, 1], "pred_proba": [0.9, 0.2, 0.7]}, request_id="batch")
+    capture.stop()
+    assert capture.stats()["captured"] == 8 and capture.stats()["write_errors"] == 0
+
+    inference = read_table(capture.output_dir)
+    assert len(inference) == 8
+    assert pd.api.types.is_integer_dtype(inference["id"])
+    assert pd.api.types.is_float_dtype(inference["heat_deviation"])
+    batch = inference[inference["request_id"] == "batch"].sort_values("id")
+    assert batch["id"].tolist() == [5, 6, 7]
+    assert batch["pred"].tolist() == [1, 0, 1]
+
+    ground_truth = pd.DataFrame({"id": range(8), "ground_truth": [0, 1, 0, 1, 0, 1, 0, 1]})
+    merged = merge_data(inference, ground_truth, "id")
+    assert len(merged) == 8
+    assert merged[["pred", "ground_truth"]].notna().all().all()
+
+
+def test_mixed_types_only_change_their_column(capture):
+    capture.submit({"id": 0, "operator": 1}, {"pred": 0})
+    capture.submit({"id": 1, "operator": "operator2"}, {"pred": 1})
+    capture.stop()
+
+    inference = read_table(capture.output_dir).sort_values("id")
+    assert inference["operator"].tolist() == ["1", "operator2"]
+    assert pd.api.types.is_integer_dtype(inference["id"])
+    assert pd.api.types.is_integer_dtype(inference["pred"])